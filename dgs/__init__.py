@@ -0,0 +1 @@
+from dgs.changes import batch_changes
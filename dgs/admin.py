@@ -1,6 +1,7 @@
 from django.contrib.admin.widgets import FilteredSelectMultiple
 from django.forms.widgets import Select
 from django.contrib import admin
+from dgs.changes import batch_changes
 from django.db import models
 from dgs.models import *
 
@@ -22,6 +23,20 @@ class ModelAdmin(admin.ModelAdmin):
         models.ForeignKey: {'widget': Select(attrs={"class": "form-control"})},
         }
 
+    # apply the changes of each save, delete or bulk action (and their inlines and
+    # many-to-many fields) in one pass
+    @batch_changes()
+    def changeform_view(self, *args, **kwargs):
+        return super(ModelAdmin, self).changeform_view(*args, **kwargs)
+
+    @batch_changes()
+    def changelist_view(self, *args, **kwargs):
+        return super(ModelAdmin, self).changelist_view(*args, **kwargs)
+
+    @batch_changes()
+    def delete_view(self, *args, **kwargs):
+        return super(ModelAdmin, self).delete_view(*args, **kwargs)
+
     class Media:
         #extend = False
         css = {'all': ('https://cdnjs.cloudflare.com/ajax/libs/bootstrap-select/1.9.4/css/bootstrap-select.min.css',)}
@@ -0,0 +1,9 @@
+from rest_framework import pagination
+
+
+class PageNumberPagination(pagination.PageNumberPagination):
+    """
+    PAGE_SIZE results per page by default, or up to max_page_size with ?page_size=.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
@@ -0,0 +1,41 @@
+from rest_framework.renderers import JSONRenderer, BaseRenderer
+from dgs import export
+
+
+class CompactJSONRenderer(JSONRenderer):
+    """
+    JSON selected with ?format=compact. Viewsets serialize related objects as primary keys
+    instead of hyperlinks when it is used, see dgs.views.ModelViewSet.
+    """
+    format = 'compact'
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Renders the records of dgs.export, one per line. Views stream them with lines()
+    instead; render() is for the odd response, eg. an error, that isn't an export.
+    """
+    charset = 'utf-8'
+
+    def lines(self, records):
+        return export.FORMATS[self.format](records)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = [data]
+        return "".join(self.lines(data))
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return "".join(export.csv_lines([data], list(data)))
+        return super(CSVRenderer, self).render(data, accepted_media_type, renderer_context)
@@ -1,64 +1,129 @@
+from django.utils.functional import lazy
 from rest_framework import serializers
+from django.utils import six
 from dgs import models
 
 
-class PlayerSerializer(serializers.HyperlinkedModelSerializer):
+class HyperlinkedRelatedField(serializers.HyperlinkedRelatedField):
+    """
+    Names hyperlinks lazily. The name is the related object's __unicode__, which can take
+    queries of its own, and is only ever shown by the browsable API.
+    """
+    def get_name(self, obj):
+        return lazy(six.text_type, six.text_type)(obj)
+
+
+class HyperlinkedModelSerializer(serializers.HyperlinkedModelSerializer):
+    serializer_related_field = HyperlinkedRelatedField
+
+
+class PlayerSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = models.Player
         fields = ('first_name', 'last_name', 'email_address', 'phone_number', 'pdga_number')
 
 
-class ContestantSerializer(serializers.HyperlinkedModelSerializer):
+class ContestantSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = models.Contestant
         fields = ('player', 'initial_handicap')
 
 
-class HoleSerializer(serializers.HyperlinkedModelSerializer):
+class HoleSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = models.Hole
         fields = ('number', 'par')
 
 
-class LayoutSerializer(serializers.HyperlinkedModelSerializer):
+class LayoutSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = models.Layout
         fields = ('name', 'holes')
 
 
-class CourseSerializer(serializers.HyperlinkedModelSerializer):
+class CourseSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = models.Course
         fields = ('name', 'layouts')
 
 
-class ScoreSerializer(serializers.HyperlinkedModelSerializer):
+class ScoreSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = models.Score
         fields = ('contestant', 'strokes', 'date')
 
 
-class CardSerializer(serializers.HyperlinkedModelSerializer):
+class CardSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = models.Card
         fields = ('course', 'layout', 'date', 'scores')
 
 
-class AwardSerializer(serializers.HyperlinkedModelSerializer):
+class AwardSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = models.Award
         fields = ('name', 'contestant')
 
 
-class EventSerializer(serializers.HyperlinkedModelSerializer):
+class EventSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = models.Event
         fields = ('name', 'date', 'rounds', 'awards', 'cards')
 
 
-class LeagueSerializer(serializers.HyperlinkedModelSerializer):
+class LeagueSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = models.League
         fields = ('name', 'contestants', 'events')
 
 
+class EntrySerializer(HyperlinkedModelSerializer):
+    """
+    Takes related objects as hyperlinks, or as primary keys if the compact format is used.
+    """
+    @property
+    def serializer_related_field(self):
+        if self.context.get('compact'):
+            return serializers.PrimaryKeyRelatedField
+        return HyperlinkedRelatedField
+
+
+class ScoreEntrySerializer(EntrySerializer):
+    class Meta:
+        model = models.Score
+        fields = ('contestant', 'strokes')
+
+
+class CardEntrySerializer(EntrySerializer):
+    """
+    A Card with all of its Scores, for entering a whole card at once. The scores are
+    dated with the card.
+    """
+    scores = ScoreEntrySerializer(many=True)
+
+    class Meta:
+        model = models.Card
+        fields = ('course', 'layout', 'date', 'scores')
+
+    def validate_scores(self, scores):
+        contestants = [score['contestant'] for score in scores]
+        if len(set(contestants)) != len(contestants):
+            raise serializers.ValidationError("A contestant can only have one score on a card")
+        return scores
+
+
+_compact_serializers = {}
+
+
+def compact(serializer_class):
+    """
+    Returns a ModelSerializer for serializer_class's model and fields, plus the object's
+    id, that represents related objects by their primary keys instead of hyperlinks.
+    """
+    if serializer_class not in _compact_serializers:
+        meta = serializer_class.Meta
+        _compact_serializers[serializer_class] = type(
+                'Compact%s' % serializer_class.__name__,
+                (serializers.ModelSerializer,),
+                {'Meta': type('Meta', (object,), {'model': meta.model, 'fields': ('id',) + tuple(meta.fields)})})
+    return _compact_serializers[serializer_class]
@@ -0,0 +1,95 @@
+"""
+Synthetic league generation and timing helpers for the dgs_bench command.
+
+Leagues are generated with bulk inserts that bypass the model signals, and their
+stored results are built once at the end, so that generating a large league
+doesn't recompute its results after every score.
+"""
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Max
+from django.utils import timezone
+from django.db import connection, reset_queries
+from dgs import models, results
+import datetime
+import random
+import time
+
+
+def bulk_create(model, objects):
+    """
+    Like bulk_create(), but returns the created objects with their pks, which
+    bulk_create() doesn't set on SQLite.
+    """
+    last_pk = model.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+    model.objects.bulk_create(objects)
+    return list(model.objects.filter(pk__gt=last_pk).order_by('pk'))
+
+
+def generate_league(name, players=20, events=10, cards_per_event=5, rounds=2, seed=0):
+    """
+    Creates a league of players contestants playing events events, each of rounds rounds
+    in which the attending contestants are split across cards_per_event cards.
+    Returns the League.
+    """
+    rnd = random.Random(seed)
+    holes = bulk_create(models.Hole, [models.Hole(number=n, par=rnd.choice((3, 3, 3, 4, 5))) for n in range(1, 19)])
+    layout = models.Layout.objects.create(name="%s layout" % name)
+    models.Layout.holes.through.objects.bulk_create([models.Layout.holes.through(layout=layout, hole=hole) for hole in holes])
+    models.Layout.update_totals([layout.pk])
+    par = sum(hole.par for hole in holes)
+    course = models.Course.objects.create(name="%s course" % name)
+    models.Course.layouts.through.objects.bulk_create([models.Course.layouts.through(course=course, layout=layout)])
+
+    league = models.League.objects.create(name=name)
+    new_players = bulk_create(models.Player, [models.Player(first_name="Player", last_name="%s %s" % (name, n)) for n in range(players)])
+    contestants = bulk_create(models.Contestant, [models.Contestant(player=player) for player in new_players])
+    models.League.contestants.through.objects.bulk_create([models.League.contestants.through(league=league, contestant=c) for c in contestants])
+    skill = dict((c.pk, rnd.gauss(8, 4)) for c in contestants)
+
+    start = timezone.make_aware(datetime.datetime(2016, 1, 1, 9, 0), timezone.utc)
+    new_events = bulk_create(models.Event, [models.Event(name="%s event %s" % (name, n), date=start + datetime.timedelta(days=7 * n), rounds=rounds, league=league)
+                                            for n in range(events)])
+    models.League.events.through.objects.bulk_create([models.League.events.through(league=league, event=event) for event in new_events])
+
+    # (event, round, card number) -> contestants on that card
+    groups = []
+    for event in new_events:
+        attending = [c for c in contestants if rnd.random() < 0.8]
+        for round_number in range(rounds):
+            rnd.shuffle(attending)
+            for card_number in range(cards_per_event):
+                group = attending[card_number::cards_per_event]
+                if group:
+                    groups.append((event, event.date + datetime.timedelta(hours=round_number, minutes=card_number), group))
+    cards = bulk_create(models.Card, [models.Card(course=course, layout=layout, date=date, event=event) for event, date, group in groups])
+    scores = bulk_create(models.Score, [models.Score(contestant=c, date=date, strokes=int(round(par + rnd.gauss(skill[c.pk], 3))), card=card)
+                                        for card, (event, date, group) in zip(cards, groups) for c in group])
+    card_scores = []
+    scores = iter(scores)
+    for card, (event, date, group) in zip(cards, groups):
+        card_scores.extend(models.Card.scores.through(card=card, score=next(scores)) for c in group)
+    models.Card.scores.through.objects.bulk_create(card_scores)
+    models.Event.cards.through.objects.bulk_create([models.Event.cards.through(event=event, card=card) for card, (event, date, group) in zip(cards, groups)])
+
+    results.refresh_league(league)
+    return league
+
+
+def measure(function, repeat=1):
+    """
+    Calls function repeat times, returning the number of queries it issued and its
+    minimum and mean wall time in seconds.
+    """
+    times = []
+    for i in range(repeat):
+        # CaptureQueriesContext miscounts once the connection's query log is full
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.time()
+            function()
+            times.append(time.time() - started)
+    return {
+        'queries': len(queries),
+        'wall_time': min(times),
+        'mean_wall_time': sum(times) / len(times),
+        }
@@ -1,6 +1,337 @@
-from django.core.cache import cache
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.utils.six.moves import queue, cPickle as pickle
+from django.core.cache import cache, caches
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connection
+from dgs import instrumentation
+import threading
+import logging
+import time
+import uuid
 
-def cache_per(ttl=None, prefix=None, cache_post=False, username=None):
+logger = logging.getLogger(__name__)
+
+# namespace whose version changes whenever any league's version changes
+GLOBAL_NAMESPACE = 'all'
+# seconds after which a revalidation lock is considered abandoned
+REVALIDATE_LOCK_TIMEOUT = 300
+# prefix of the keys holding each namespace's version
+VERSION_KEY_PREFIX = 'version_'
+
+
+def league_namespace(league_pk):
+    return 'league_%s' % league_pk
+
+
+def event_namespace(event_pk):
+    return 'event_%s' % event_pk
+
+
+def card_namespace(card_pk):
+    return 'card_%s' % card_pk
+
+
+def instance_namespace(instance):
+    """
+    Returns the namespace of a League, Event or Card instance, eg. 'event_3'
+    """
+    return '%s_%s' % (instance._meta.model_name, instance.pk)
+
+
+def get_version(namespace):
+    """
+    Returns the current cache version of namespace. Cached values are stored against
+    this version, so bumping it invalidates everything in the namespace at once.
+    """
+    key = VERSION_KEY_PREFIX + namespace
+    version = cache.get(key)
+    if version is None:
+        # start from the current time rather than 1 so that a version lost to eviction
+        # doesn't resurrect values cached against an earlier version
+        cache.add(key, int(time.time()), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    key = VERSION_KEY_PREFIX + namespace
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time()), None)
+
+
+def invalidate_leagues(league_pks):
+    """
+    Invalidates everything cached for the given leagues, and anything that depends on all leagues.
+    """
+    if not league_pks:
+        return
+    for league_pk in league_pks:
+        bump_version(league_namespace(league_pk))
+    bump_version(GLOBAL_NAMESPACE)
+
+
+class TwoTierCache(BaseCache):
+    """
+    A cache backend that keeps a bounded, per-process LRU of recently used values in
+    front of a shared cache backend (eg. the database or file based cache), so that
+    repeated reads of the same value don't cost a round-trip to the shared cache.
+
+    Every change to a namespace version (see bump_version()), and every clear, replaces
+    the generation token held in the shared cache. Before reading from the local tier,
+    the generation is compared against the one the local tier was filled under (at most
+    once every GENERATION_CHECK_INTERVAL seconds), and the local tier is emptied if it
+    changed. Other writes leave the generation alone: values set against a namespace
+    version belong to that version, and the unversioned values this app replaces, such
+    as stale-while-revalidate entries and the players' shortest names, are only replaced
+    along with a version change or are checked against one when read. So a revalidation
+    doesn't empty every process's local tier.
+
+    Configure it with the alias of the shared cache in OPTIONS, eg:
+
+        'default': {
+            'BACKEND': 'dgs.cache.TwoTierCache',
+            'OPTIONS': {'SHARED': 'shared', 'MAX_ENTRIES': 500},
+        }
+    """
+    GENERATION_KEY = 'dgs_cache_generation'
+
+    # process wide state for each configured cache, since Django creates a backend
+    # instance per thread
+    _states = {}
+    _states_lock = threading.Lock()
+
+    def __init__(self, location, params):
+        super(TwoTierCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.check_interval = options.get('GENERATION_CHECK_INTERVAL', 1)
+        with self._states_lock:
+            self.state = self._states.setdefault(location or self.shared_alias, {
+                'entries': OrderedDict(),
+                'lock': threading.Lock(),
+                'generation': None,
+                'checked': 0,
+                'stats': {'local': self.new_stats(), 'shared': self.new_stats()},
+                })
+
+    @staticmethod
+    def new_stats():
+        return {'hits': 0, 'misses': 0, 'time': 0.0}
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def record(self, tier, hit, started):
+        stats = self.state['stats'][tier]
+        stats['hits' if hit else 'misses'] += 1
+        stats['time'] += time.time() - started
+
+    def stats(self):
+        """
+        Returns the hits, misses, hit rate and total time spent reading from each tier
+        by this process.
+        """
+        result = {}
+        for tier, stats in self.state['stats'].items():
+            reads = stats['hits'] + stats['misses']
+            result[tier] = dict(stats, hit_rate=reads and float(stats['hits']) / reads or None)
+        result['local']['entries'] = len(self.state['entries'])
+        return result
+
+    def reset_stats(self):
+        self.state['stats'] = {'local': self.new_stats(), 'shared': self.new_stats()}
+
+    def check_generation(self):
+        """
+        Empties the local tier if the shared generation has moved on since it was filled.
+        """
+        state = self.state
+        now = time.time()
+        if state['generation'] is not None and now - state['checked'] < self.check_interval:
+            return
+        generation = self.shared.get(self.GENERATION_KEY)
+        if generation is None:
+            self.shared.add(self.GENERATION_KEY, uuid.uuid4().hex, None)
+            generation = self.shared.get(self.GENERATION_KEY)
+        with state['lock']:
+            if generation != state['generation']:
+                state['entries'].clear()
+                state['generation'] = generation
+            state['checked'] = now
+
+    def bump_generation(self):
+        # a new token rather than an incr, which isn't atomic for every backend, eg. the
+        # database cache
+        generation = uuid.uuid4().hex
+        self.shared.set(self.GENERATION_KEY, generation, None)
+        with self.state['lock']:
+            # other processes may also have written since we last looked
+            self.state['entries'].clear()
+            self.state['generation'] = generation
+            self.state['checked'] = time.time()
+
+    @staticmethod
+    def is_version_key(key, version):
+        return version is None and key.startswith(VERSION_KEY_PREFIX)
+
+    def get_local(self, key):
+        state = self.state
+        with state['lock']:
+            entry = state['entries'].pop(key, None)
+            if entry is None:
+                return None
+            expires, pickled = entry
+            if expires is not None and expires <= time.time():
+                return None
+            state['entries'][key] = entry
+        return pickle.loads(pickled)
+
+    def set_local(self, key, value, timeout=DEFAULT_TIMEOUT):
+        state = self.state
+        entry = (self.get_backend_timeout(timeout), pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with state['lock']:
+            state['entries'].pop(key, None)
+            state['entries'][key] = entry
+            while len(state['entries']) > self._max_entries:
+                state['entries'].popitem(last=False)
+
+    def delete_local(self, key):
+        with self.state['lock']:
+            self.state['entries'].pop(key, None)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version=version)
+        self.validate_key(local_key)
+        self.check_generation()
+        started = time.time()
+        value = self.get_local(local_key)
+        self.record('local', value is not None, started)
+        if value is not None:
+            instrumentation.record_cache(key, True)
+            return value
+        started = time.time()
+        value = self.shared.get(key, version=version)
+        self.record('shared', value is not None, started)
+        instrumentation.record_cache(key, value is not None)
+        if value is None:
+            return default
+        self.set_local(local_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_key(key, version=version)
+        self.validate_key(local_key)
+        self.shared.set(key, value, timeout, version=version)
+        if self.is_version_key(key, version):
+            self.bump_generation()
+        self.set_local(local_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self.shared.add(key, value, timeout, version=version):
+            return False
+        self.delete_local(self.make_key(key, version=version))
+        return True
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version=version)
+        if self.is_version_key(key, version):
+            self.bump_generation()
+        self.delete_local(self.make_key(key, version=version))
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        if self.is_version_key(key, version):
+            self.bump_generation()
+        self.delete_local(self.make_key(key, version=version))
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def clear(self):
+        self.shared.clear()
+        self.bump_generation()
+        with self.state['lock']:
+            self.state['entries'].clear()
+
+
+class RevalidationWorker(object):
+    """
+    A single background thread per process that recomputes stale cached values one at a time.
+    """
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, task):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="dgs-revalidate")
+                self.thread.daemon = True
+                self.thread.start()
+        self.queue.put(task)
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+            try:
+                task()
+            except Exception:
+                logger.exception("Background revalidation failed")
+            finally:
+                # don't hold on to a DB connection between tasks
+                connection.close()
+
+revalidation_worker = RevalidationWorker()
+
+
+def revalidate(key, compute, version, ttl=None):
+    """
+    Recomputes the value cached under key for version, in the background unless
+    settings.DGS_BACKGROUND_REVALIDATION is False. Only one recomputation per key
+    runs at a time across all processes sharing the cache.
+    """
+    lock_key = 'revalidate_lock_%s' % key
+    if not cache.add(lock_key, version, REVALIDATE_LOCK_TIMEOUT):
+        # someone else is already recomputing this key
+        return
+
+    def task():
+        try:
+            cache.set(key, (version, compute()), ttl)
+        finally:
+            cache.delete(lock_key)
+
+    if getattr(settings, 'DGS_BACKGROUND_REVALIDATION', True):
+        revalidation_worker.submit(task)
+    else:
+        task()
+
+
+def get_stale_while_revalidate(key, compute, namespace, ttl=None):
+    """
+    Returns the value cached under key for the current version of namespace, computing it
+    with compute() if nothing has been cached yet. If only a value for an older version is
+    cached, it is returned straight away while a single background worker recomputes it.
+    """
+    version = get_version(namespace)
+    entry = cache.get(key)
+    if entry is not None:
+        cached_version, value = entry
+        if cached_version != version:
+            revalidate(key, compute, version, ttl)
+        return value
+    value = compute()
+    cache.set(key, (version, value), ttl)
+    return value
+
+
+def cache_per(ttl=None, prefix=None, cache_post=False, username=None, namespace=None, stale_while_revalidate=False):
     def decorator(function):
         def apply_cache(request, *args, **kwargs):
             if not username:
@@ -14,19 +345,22 @@ def cache_per(ttl=None, prefix=None, cache_post=False, username=None):
             if prefix:
                 CACHE_KEY = '%s_%s'%(prefix, user)
             else:
-                CACHE_KEY = 'view_cache_%s_%s'%(function.__name__, user)       
+                CACHE_KEY = 'view_cache_%s_%s'%(function.__name__, user)
 
             if not cache_post and request.method == 'POST':
                 can_cache = False
                 response = None
+            elif namespace and stale_while_revalidate:
+                return get_stale_while_revalidate(CACHE_KEY, lambda: function(request, *args, **kwargs), namespace, ttl)
             else:
                 can_cache = True
-                response = cache.get(CACHE_KEY, None)
+                version = namespace and get_version(namespace) or None
+                response = cache.get(CACHE_KEY, None, version=version)
 
             if not response:
                 response = function(request, *args, **kwargs)
                 if can_cache:
-                    cache.set(CACHE_KEY, response, ttl)
+                    cache.set(CACHE_KEY, response, ttl, version=version)
             return response
         return apply_cache
     return decorator
@@ -0,0 +1,52 @@
+"""
+An index of the cards each contestant completed in a league, for finding a
+contestant's latest completed cards as at an event without scanning the league.
+"""
+from collections import namedtuple, defaultdict
+from bisect import bisect_right
+
+CompletedCard = namedtuple('CompletedCard', ('event_date', 'card', 'scratch_delta'))
+
+
+class CompletedCardIndex(object):
+    """
+    Each contestant's completed cards, latest card first, built from a league's events.
+
+    latest() finds the cards from events on or before a date with a binary search, so
+    takes O(log n + N) for N cards. That relies on a contestant's later cards being
+    from later events, which is the case unless a card was entered with a date outside
+    its event; latest() falls back to a scan for contestants where it isn't.
+    """
+
+    def __init__(self, events):
+        entries = defaultdict(list)
+        for event in events:
+            for card in event.cards.all():
+                for contestant, stats in card.result.items():
+                    if card.completed(contestant):
+                        entries[contestant.pk].append(CompletedCard(event.date, card, int(stats['scratch_delta'])))
+        self.cards = {}
+        # contestant pk -> event dates of their cards, earliest first, for contestants whose
+        # cards are in the same order by event date as by card date
+        self.event_dates = {}
+        for pk, cards in entries.items():
+            # latest first, keeping cards with the same date in league order
+            cards.sort(key=lambda completed_card: completed_card.card.date, reverse=True)
+            self.cards[pk] = cards
+            event_dates = [completed_card.event_date for completed_card in reversed(cards)]
+            if all(earlier <= later for earlier, later in zip(event_dates, event_dates[1:])):
+                self.event_dates[pk] = event_dates
+
+    def latest(self, contestant_pk, date=None, n=None):
+        """
+        Returns up to n of the contestant's latest CompletedCards from events on or before
+        date (or from all events if date is None), latest first.
+        """
+        cards = self.cards.get(contestant_pk, [])
+        if date is not None:
+            event_dates = self.event_dates.get(contestant_pk)
+            if event_dates is None:
+                cards = [completed_card for completed_card in cards if completed_card.event_date <= date]
+            else:
+                cards = cards[len(cards) - bisect_right(event_dates, date):]
+        return cards[:n]
@@ -0,0 +1,93 @@
+"""
+Applies model changes to everything derived from them: the cached leagues, events and
+cards, the data versions and the stored results.
+
+Each change is normally applied as soon as it is saved. Inside batch_changes() the
+leagues and cards each change affects are collected instead, and applied together in a
+single pass when the block exits, so that a batch of changes to a league invalidates and
+recomputes it once rather than once per change. loaddata and the admin site make their
+changes in a batch.
+"""
+from django.utils.decorators import ContextDecorator
+from dgs.cache import league_namespace, GLOBAL_NAMESPACE
+import threading
+
+_local = threading.local()
+
+
+class Changes(object):
+    """
+    The leagues and cards affected by a batch of model changes.
+    """
+    def __init__(self):
+        # League pk to earliest affected Event, as returned by results.get_affected_leagues()
+        self.affected = {}
+        self.affected_cards = set()
+        # the subset of affected whose stored results need refreshing
+        self.refresh = {}
+        self.changed = False
+
+    def add(self, affected, affected_cards, refresh=True):
+        from dgs import results
+        self.changed = True
+        results.merge_affected(self.affected, affected)
+        self.affected_cards.update(affected_cards)
+        if refresh:
+            results.merge_affected(self.refresh, affected)
+
+    def apply(self):
+        if self.changed:
+            apply(self.affected, self.affected_cards, self.refresh)
+
+
+def current():
+    """
+    Returns the Changes being collected by batch_changes() in this thread, or None.
+    """
+    return getattr(_local, 'changes', None)
+
+
+class BatchChanges(ContextDecorator):
+    """
+    Collects the changes made to the league data inside the block, and applies them in one
+    pass on exit. Nested blocks are part of the outermost one. Use it outside of any
+    transaction the changes are made in, so that they are applied once committed. If the
+    outermost block exits with an exception, the changes are discarded, as the transaction
+    they were made in is rolled back.
+
+    The nesting is tracked per thread, so one instance can decorate a function (eg. an
+    admin view) that runs in many threads at once.
+    """
+    def __enter__(self):
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        if _local.depth == 1:
+            _local.changes = Changes()
+        return current()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.depth -= 1
+        if _local.depth == 0:
+            changes = _local.changes
+            del _local.changes
+            if exc_type is None:
+                changes.apply()
+
+
+def batch_changes():
+    """
+    Returns a context manager, also usable as a decorator, that applies the changes made
+    inside it in one pass on exit. See BatchChanges.
+    """
+    return BatchChanges()
+
+
+def apply(affected, affected_cards, refresh):
+    """
+    Invalidates the cache of the affected leagues and cards, bumps their data versions and
+    refreshes the stored results of the leagues in refresh. affected and refresh are as
+    returned by results.get_affected_leagues().
+    """
+    from dgs import invalidation, results, models
+    invalidation.invalidate(affected, affected_cards)
+    models.DataVersion.bump([GLOBAL_NAMESPACE] + [league_namespace(league_pk) for league_pk in affected])
+    results.refresh(refresh)
@@ -0,0 +1,107 @@
+"""
+Export of a league's whole history: its events, cards, scores and per-event results, as
+records that are written out as NDJSON or CSV one at a time.
+
+Each kind of record is read with a single values_list() query run with iterator(), so
+memory use doesn't grow with the length of the league's history. The per-event results
+are those stored in EventResultRow (see dgs.results), since computing them needs the
+whole league in memory.
+"""
+from collections import OrderedDict
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.encoding import smart_str
+from dgs import models
+import datetime
+import json
+import csv
+
+# the fields of each kind of record, after its 'record' field naming the kind
+RECORDS = OrderedDict([
+    ('event', ('id', 'name', 'date', 'rounds')),
+    ('card', ('id', 'event', 'date', 'course', 'layout', 'par')),
+    ('score', ('id', 'card', 'event', 'contestant', 'player', 'strokes', 'date')),
+    ('result', ('event', 'contestant', 'player', 'position', 'rank', 'round_count', 'rounds_played', 'completed_event',
+                'scratch_score', 'previous_handicap', 'handicap', 'handicap_score', 'points_earned', 'awards')),
+    ])
+
+
+def record(kind, values):
+    return OrderedDict(zip(('record',) + RECORDS[kind], (kind,) + tuple(values)))
+
+
+def get_records(league):
+    """
+    Yields league's history as records, each an OrderedDict of the fields in RECORDS: its
+    events in date order, then their cards, then their scores, then their results.
+    """
+    events = models.Event.objects.filter(league=league).order_by('date', 'pk')
+    for values in events.values_list('pk', 'name', 'date', 'rounds').iterator():
+        yield record('event', values)
+
+    cards = models.Card.objects.filter(event__league=league).order_by('event__date', 'event', 'date', 'pk')
+    for values in cards.values_list('pk', 'event', 'date', 'course__name', 'layout__name', 'layout__par').iterator():
+        yield record('card', values)
+
+    scores = models.Score.objects.filter(card__event__league=league).order_by('card__event__date', 'card__event', 'card__date', 'card', 'pk')
+    for values in scores.values_list('pk', 'card', 'card__event', 'contestant', 'contestant__player__first_name',
+                                     'contestant__player__last_name', 'strokes', 'date').iterator():
+        pk, card, event, contestant, first_name, last_name, strokes, date = values
+        yield record('score', (pk, card, event, contestant, "%s %s" % (first_name, last_name), strokes, date))
+
+    rows = models.EventResultRow.objects.filter(event__league=league).order_by('event__date', 'event', 'position')
+    for values in rows.values_list('event', 'contestant', 'contestant__player__first_name', 'contestant__player__last_name',
+                                   'position', 'rank', 'round_count', 'rounds_played', 'completed_event', 'scratch_score',
+                                   'previous_handicap', 'handicap', 'handicap_score', 'points_earned', 'awards').iterator():
+        event, contestant, first_name, last_name = values[:4]
+        yield record('result', (event, contestant, "%s %s" % (first_name, last_name)) + values[4:-1] + (json.loads(values[-1]),))
+
+
+def ndjson_lines(records):
+    """
+    Yields each of records as a line of JSON.
+    """
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+
+
+class Echo(object):
+    """
+    A file-like object whose write() returns what is written, for csv.writer to write to.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime.datetime):
+        return DjangoJSONEncoder().default(value)
+    if isinstance(value, list):
+        # eg. the names of a result's awards, which may be unnamed
+        return "; ".join(smart_str(v) for v in value if v is not None)
+    return smart_str(value)
+
+
+def csv_lines(records, fields=None):
+    """
+    Yields a header of fields, by default 'record' followed by the fields of every kind of
+    record, then each of records as a line of CSV. Fields a record doesn't have are empty.
+    """
+    if fields is None:
+        fields = ['record']
+        for kind_fields in RECORDS.values():
+            for field in kind_fields:
+                if field not in fields:
+                    fields.append(field)
+    writer = csv.writer(Echo())
+    yield writer.writerow([smart_str(field) for field in fields])
+    for record in records:
+        yield writer.writerow([csv_value(record.get(field)) for field in fields])
+
+
+# format name -> function yielding the lines of records in that format
+FORMATS = {
+    'ndjson': ndjson_lines,
+    'csv': csv_lines,
+    }
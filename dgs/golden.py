@@ -0,0 +1,92 @@
+"""
+Golden result snapshots, for checking that changes to how results are computed
+leave every rank, handicap and point unchanged.
+
+snapshot() captures the result of every event and league in the database in a
+canonical, JSON serialisable form. diff() compares two snapshots field by field.
+The golden snapshot of support/dgscored_testdata.json is checked in next to it,
+and is compared against by the test suite and the dgs_golden command.
+"""
+from django.db import connection, transaction
+from django.core import serializers
+from dgs import models, results
+import json
+import os
+
+SUPPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'support')
+TESTDATA = os.path.join(SUPPORT_DIR, 'dgscored_testdata.json')
+GOLDEN = os.path.join(SUPPORT_DIR, 'dgscored_testdata_golden.json')
+
+
+def load_testdata(path=TESTDATA):
+    """
+    Loads the dgs objects (but not the users, sessions etc.) from a fixture file and
+    builds their stored results.
+    """
+    with open(path) as f:
+        data = f.read()
+    with transaction.atomic():
+        with connection.constraint_checks_disabled():
+            for obj in serializers.deserialize('json', data):
+                if obj.object._meta.app_label == 'dgs':
+                    obj.save()
+    for league in models.League.objects.all():
+        results.refresh_league(league)
+
+
+def snapshot():
+    """
+    Returns the result of every league and event in the database, in order, keyed by
+    'league <pk>' and 'event <pk>', along with every contestant's initial handicap
+    (as seeded when the stored results are refreshed).
+    """
+    golden = {}
+    for league in models.League.objects.order_by('pk'):
+        golden['league %s' % league.pk] = [dict(stats, player=player.pk) for player, stats in league.result.items()]
+        for event in league.get_snapshot().events:
+            golden['event %s' % event.pk] = [dict(stats, contestant=contestant.pk) for contestant, stats in event.result.items()]
+    golden['initial_handicaps'] = dict(('contestant %s' % pk, initial_handicap)
+                                       for pk, initial_handicap in models.Contestant.objects.values_list('pk', 'initial_handicap'))
+    return golden
+
+
+def dumps(golden):
+    return json.dumps(golden, indent=1, sort_keys=True, separators=(',', ': '))
+
+
+def load(path=GOLDEN):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(golden, path=GOLDEN):
+    with open(path, 'w') as f:
+        f.write(dumps(golden) + "\n")
+
+
+def diff(expected, actual, path=''):
+    """
+    Returns a list of the differences between two snapshots, one per differing field,
+    eg. "event 3[1].handicap: 2.4 != 2.5". Floats must be exactly equal.
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = []
+        for key in sorted(set(expected) | set(actual)):
+            name = '%s.%s' % (path, key) if path else key
+            if key not in actual:
+                differences.append("%s: missing" % name)
+            elif key not in expected:
+                differences.append("%s: unexpected" % name)
+            else:
+                differences += diff(expected[key], actual[key], name)
+        return differences
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return ["%s: %s rows != %s rows" % (path, len(expected), len(actual))]
+        differences = []
+        for n, (expected_row, actual_row) in enumerate(zip(expected, actual)):
+            differences += diff(expected_row, actual_row, '%s[%s]' % (path, n))
+        return differences
+    if expected != actual or type(expected) is float and type(actual) is not float:
+        return ["%s: %r != %r" % (path, expected, actual)]
+    return []
@@ -0,0 +1,169 @@
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class HandicapEngine(object):
+    """
+    Walks a LeagueSnapshot's events once in date order, carrying each contestant's
+    running handicap forward from one event to the next.
+
+    The handicaps returned by run() are an OrderedDict keyed by Event pk in walk order,
+    each value being a dict keyed by Contestant pk of {'previous_handicap': ..., 'handicap': ...}
+    for every contestant who has a score on a card in that event.
+
+    The average of each contestant's best handicap_min_rounds_avg of their latest
+    handicap_max_rounds_avg completed cards as at each event is calculated up front for
+    all contestants and events at once, with NumPy if it is installed (and use_numpy
+    isn't False), else in pure Python. Both give identical results.
+    """
+
+    def __init__(self, snapshot, use_numpy=None):
+        self.snapshot = snapshot
+        self.league = snapshot.league
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+
+    def get_events(self):
+        return self.snapshot.events_by_date
+
+    def get_total_rounds(self, events):
+        """
+        returns a dict of Contestant pk to the number of scores recorded for them in this league
+        """
+        total_rounds = {}
+        for event in events:
+            for card in event.cards.all():
+                for score in card.scores.all():
+                    total_rounds[score.contestant_id] = total_rounds.get(score.contestant_id, 0) + 1
+        return total_rounds
+
+    def get_contestants(self, events):
+        """
+        Returns a dict of Event pk to the pks of the contestants with a score in that event.
+        """
+        contestants = {}
+        for event in events:
+            contestants[event.pk] = set(score.contestant_id for card in event.cards.all() for score in card.scores.all())
+        return contestants
+
+    def get_averages(self, events):
+        """
+        Returns a dict of Event pk to a dict of Contestant pk to the average of the
+        contestant's best scratch deltas as at that event, or None if they hadn't completed
+        a card yet.
+        """
+        if self.use_numpy:
+            return self.get_averages_numpy(events)
+        return self.get_averages_python(events)
+
+    def get_averages_python(self, events):
+        max_cards = self.league.handicap_max_rounds_avg
+        best_cards = self.league.handicap_min_rounds_avg
+        card_index = self.snapshot.get_card_index()
+        averages = {}
+        for event_pk, contestant_pks in self.get_contestants(events).items():
+            event_date = self.snapshot.get_event(event_pk).date
+            event_averages = averages[event_pk] = {}
+            for pk in contestant_pks:
+                best = sorted(completed_card.scratch_delta for completed_card in card_index.latest(pk, event_date, max_cards))[:best_cards]
+                event_averages[pk] = float(sum(best)) / len(best) if best else None
+        return averages
+
+    def get_averages_numpy(self, events):
+        """
+        As get_averages_python(), but works on a contestants x cards matrix of scratch
+        deltas, calculating every contestant's average as at an event date in one go.
+        """
+        max_cards = self.league.handicap_max_rounds_avg
+        best_cards = self.league.handicap_min_rounds_avg
+        card_index = self.snapshot.get_card_index()
+        contestants = self.get_contestants(events)
+        pks = sorted(set(pk for contestant_pks in contestants.values() for pk in contestant_pks))
+        row = dict((pk, i) for i, pk in enumerate(pks))
+        dates = sorted(set(event.date for event in events))
+        date_index = dict((date, i) for i, date in enumerate(dates))
+        width = max([len(card_index.latest(pk)) for pk in pks] or [0])
+
+        # deltas[i, j] is the scratch delta of contestant i's jth latest card, and
+        # card_dates[i, j] the index of the date of the event it was in
+        deltas = numpy.zeros((len(pks), width))
+        card_dates = numpy.full((len(pks), width), len(dates), dtype=int)
+        for pk in pks:
+            for j, completed_card in enumerate(card_index.latest(pk)):
+                deltas[row[pk], j] = completed_card.scratch_delta
+                card_dates[row[pk], j] = date_index[completed_card.event_date]
+
+        averages_by_date = {}
+        for date, i in date_index.items():
+            counted = card_dates <= i
+            # only the latest max_cards cards as at this date
+            counted &= numpy.cumsum(counted, axis=1) <= max_cards
+            best = numpy.sort(numpy.where(counted, deltas, numpy.inf), axis=1)[:, :best_cards]
+            finite = numpy.isfinite(best)
+            counts = finite.sum(axis=1)
+            totals = numpy.where(finite, best, 0).sum(axis=1)
+            averages_by_date[date] = (totals, counts)
+
+        averages = {}
+        for event in events:
+            totals, counts = averages_by_date[event.date]
+            averages[event.pk] = dict((pk, float(totals[row[pk]]) / int(counts[row[pk]]) if counts[row[pk]] else None)
+                                      for pk in contestants[event.pk])
+        return averages
+
+    def run(self):
+        """
+        Returns the handicaps, and a dict of Contestant pk to the initial handicap seeded
+        for each contestant without one who has played handicap_min_rounds rounds. Nothing
+        is saved, see dgs.results.seed_initial_handicaps().
+        """
+        events = self.get_events()
+        averages = self.get_averages(events)
+        handicaps, seeds = self.walk(events, averages, {})
+        if seeds:
+            # a contestant just had their initial handicap seeded, re-walk so that earlier
+            # events are retro-calculated using it.
+            handicaps = self.walk(events, averages, seeds)[0]
+        return handicaps, seeds
+
+    def walk(self, events, averages, seeds):
+        """
+        Returns the handicaps, and the initial handicaps seeded along the way, using the
+        initial handicaps in seeds in place of the contestants' own.
+        """
+        league = self.league
+        total_rounds = self.get_total_rounds(events)
+        running = {}
+        seeds = dict(seeds)
+        handicaps = OrderedDict()
+        for event in events:
+            event_handicaps = handicaps[event.pk] = {}
+            for card in event.cards.all():
+                for score in card.scores.all():
+                    contestant = score.contestant
+                    if contestant.pk in event_handicaps:
+                        continue
+                    initial_handicap = seeds.get(contestant.pk, contestant.initial_handicap)
+                    if contestant.pk in running:
+                        previous_handicap = running[contestant.pk]
+                    else:
+                        previous_handicap = initial_handicap
+                    # calculate new handicap
+                    average = averages[event.pk][contestant.pk]
+                    if average is None:
+                        handicap = previous_handicap
+                    else:
+                        # round to 2 decimal places
+                        handicap = round(average * league.handicap_multiplier, 2)
+                        # seed the contestant's initial handicap with the handicap if they played the required number of rounds
+                        if initial_handicap == None and total_rounds.get(contestant.pk, 0) == league.handicap_min_rounds:
+                            seeds[contestant.pk] = handicap
+                    running[contestant.pk] = handicap
+                    event_handicaps[contestant.pk] = {
+                            'previous_handicap': previous_handicap,
+                            'handicap': handicap,
+                            }
+        return handicaps, seeds
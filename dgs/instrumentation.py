@@ -0,0 +1,91 @@
+"""
+Per-request instrumentation: SQL query count and time, cache hits and misses by
+key prefix, and wall time spent in instrumented functions.
+
+InstrumentationMiddleware starts recording at the start of each request and reports
+what was recorded in the response headers and the 'dgs.instrumentation' log. Outside
+of a request (or in other threads), nothing is recorded.
+"""
+from collections import defaultdict
+from functools import wraps
+import threading
+import time
+import re
+
+_local = threading.local()
+
+# trailing key segments containing digits, eg. the '_3' of 'fragment_event_result_3'
+KEY_ID = re.compile(r'(_[^_]*\d[^_]*)+$')
+
+
+class RequestStats(object):
+    """
+    What has been recorded during the current request.
+    """
+    def __init__(self):
+        self.started = time.time()
+        # name -> [calls, seconds]
+        self.timings = defaultdict(lambda: [0, 0.0])
+        # key prefix -> [hits, misses]
+        self.cache = defaultdict(lambda: [0, 0])
+        # names of the timed functions currently being called, so that recursive
+        # calls aren't counted twice
+        self.active = set()
+
+    def as_dict(self):
+        return {
+            'time': time.time() - self.started,
+            'timings': dict((name, {'calls': calls, 'time': seconds}) for name, (calls, seconds) in self.timings.items()),
+            'cache': dict((prefix, {'hits': hits, 'misses': misses}) for prefix, (hits, misses) in self.cache.items()),
+            }
+
+
+def start():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def stop():
+    stats = current()
+    _local.stats = None
+    return stats
+
+
+def current():
+    """
+    Returns the RequestStats of the current request, or None if not recording.
+    """
+    return getattr(_local, 'stats', None)
+
+
+def timed(name):
+    """
+    Decorator that records the number of calls to, and wall time spent in, the
+    decorated function under name.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            stats = current()
+            if stats is None or name in stats.active:
+                return function(*args, **kwargs)
+            stats.active.add(name)
+            started = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.active.discard(name)
+                timing = stats.timings[name]
+                timing[0] += 1
+                timing[1] += time.time() - started
+        return wrapper
+    return decorator
+
+
+def record_cache(key, hit):
+    """
+    Records a cache hit or miss of key against its prefix, eg. 'fragment_event_result'.
+    """
+    stats = current()
+    if stats is not None:
+        stats.cache[KEY_ID.sub('', key)][0 if hit else 1] += 1
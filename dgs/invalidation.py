@@ -0,0 +1,55 @@
+"""
+Works out which cached leagues, events and cards a model change invalidates.
+
+A change to an event's cards or scores changes the results of that event and every
+event after it in the league (handicaps carry forward), plus the league standings.
+Card fragments only change when the card itself, its scores, or the players, layout
+or course shown on it change.
+"""
+from dgs.cache import bump_version, event_namespace, card_namespace, invalidate_leagues
+from dgs import models
+
+
+def get_affected_cards(instance, affected=None):
+    """
+    Returns a set of the pks of Cards whose rendering depends on instance.
+    If given, affected is updated in place.
+    """
+    if affected is None:
+        affected = set()
+    cards = None
+    if isinstance(instance, models.Card):
+        affected.add(instance.pk)
+    elif isinstance(instance, models.Score):
+        cards = models.Card.objects.filter(pk__in=models.Score.objects.filter(pk=instance.pk).values('card'))
+    elif isinstance(instance, models.Contestant):
+        cards = models.Card.objects.filter(scores__contestant=instance)
+    elif isinstance(instance, models.Player):
+        cards = models.Card.objects.filter(scores__contestant__player=instance)
+    elif isinstance(instance, models.Layout):
+        cards = models.Card.objects.filter(layout=instance)
+    elif isinstance(instance, models.Hole):
+        cards = models.Card.objects.filter(layout__holes=instance)
+    elif isinstance(instance, models.Course):
+        cards = models.Card.objects.filter(course=instance)
+    if cards is not None:
+        affected.update(cards.values_list('pk', flat=True))
+    return affected
+
+
+def invalidate(affected_leagues, affected_cards):
+    """
+    Bumps the cache versions of the given cards, of the events of affected_leagues from
+    their earliest affected event onwards, and of the leagues themselves.
+    affected_leagues is as returned by dgs.results.get_affected_leagues().
+    """
+    for league_pk, since in affected_leagues.items():
+        events = models.Event.objects.filter(league=league_pk)
+        if since is not None:
+            # including events at the same date, whose handicaps count each other's cards
+            events = events.filter(date__gte=since.date)
+        for event_pk in events.values_list('pk', flat=True):
+            bump_version(event_namespace(event_pk))
+    for card_pk in affected_cards:
+        bump_version(card_namespace(card_pk))
+    invalidate_leagues(affected_leagues.keys())
@@ -0,0 +1,106 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management import call_command
+from django.core.cache import cache, caches
+from django.test import Client
+from django.db import connection
+from dgs import models, bench, results, invalidation
+import platform
+import json
+import time
+
+
+API_ENDPOINTS = ('league', 'event', 'card', 'score', 'contestant')
+AFFECTED_LOOKUP_SCORES = 200
+
+
+class Command(BaseCommand):
+    help = ("Generates synthetic leagues in an SQLite database and reports the query count and wall time of rendering "
+            "the home page, computing league and event results and listing the API endpoints, as JSON. "
+            "Run with --settings=dgscored.bench_settings.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leagues', type=int, default=1, help="Number of leagues to generate.")
+        parser.add_argument('--players', type=int, default=20, help="Number of contestants per league.")
+        parser.add_argument('--events', type=int, default=10, help="Number of events per league.")
+        parser.add_argument('--cards-per-event', type=int, default=5, help="Number of cards the players of each event round are split across.")
+        parser.add_argument('--rounds', type=int, default=2, help="Number of rounds per event.")
+        parser.add_argument('--repeat', type=int, default=3, help="Number of times to repeat each measurement.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the generated scores.")
+        parser.add_argument('--output', help="File to write the JSON report to. Defaults to stdout.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("dgs_bench writes synthetic data to the database, so only runs against SQLite. "
+                               "Use --settings=dgscored.bench_settings.")
+        call_command('migrate', interactive=False, verbosity=0)
+        call_command('createcachetable', verbosity=0)
+
+        parameters = dict((name, options[name]) for name in ('leagues', 'players', 'events', 'cards_per_event', 'rounds', 'repeat', 'seed'))
+        started = time.time()
+        for n in range(options['leagues']):
+            bench.generate_league("Bench %s" % n, players=options['players'], events=options['events'],
+                                  cards_per_event=options['cards_per_event'], rounds=options['rounds'], seed=options['seed'] + n)
+        generate_time = time.time() - started
+
+        client = Client()
+        repeat = options['repeat']
+
+        def cold(function):
+            def run():
+                cache.clear()
+                function()
+            return run
+
+        def league_results():
+            for league in models.League.objects.all():
+                league.result
+
+        def event_results():
+            for league in models.League.objects.all():
+                for event in league.get_snapshot().events:
+                    event.result
+
+        scores = list(models.Score.objects.order_by('pk')[:AFFECTED_LOOKUP_SCORES])
+
+        def affected_lookups():
+            # what a change to each score looks up to work out what it invalidates
+            for score in scores:
+                results.get_affected_leagues(score)
+                invalidation.get_affected_cards(score)
+
+        benchmarks = [
+            ('home', lambda: client.get('/')),
+            ('league_result', league_results),
+            ('event_result', event_results),
+            ('affected_lookups', affected_lookups),
+            ]
+        benchmarks += [('api_%s_list' % name, lambda name=name: client.get('/api/%s/' % name)) for name in API_ENDPOINTS]
+
+        report = {
+            'parameters': parameters,
+            'environment': {
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'cache': caches['default'].__class__.__name__,
+                },
+            'generate_time': generate_time,
+            'objects': dict((model.__name__, model.objects.count()) for model in (models.League, models.Event, models.Card, models.Score)),
+            'benchmarks': {},
+            }
+        if hasattr(cache, 'stats'):
+            cache.reset_stats()
+        for name, function in benchmarks:
+            report['benchmarks'][name] = {
+                'cold': bench.measure(cold(function), repeat),
+                'warm': bench.measure(function, repeat),
+                }
+        if hasattr(cache, 'stats'):
+            # hits, misses and read time of each tier of a TwoTierCache, over all the benchmarks
+            report['cache_stats'] = cache.stats()
+
+        output = json.dumps(report, indent=2, sort_keys=True, separators=(',', ': '))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from dgs import models, export
+
+
+class Command(BaseCommand):
+    help = ("Writes the whole history of a league, its events, cards, scores and per-event results, one record per line "
+            "as NDJSON or CSV. Records are read and written one at a time, however long the league's history.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('league_id', type=int, help="ID of the league to export.")
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='ndjson', help="Format to write. Defaults to ndjson.")
+        parser.add_argument('--output', help="File to write the export to. Defaults to stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            league = models.League.objects.get(pk=options['league_id'])
+        except models.League.DoesNotExist:
+            raise CommandError("League %s does not exist" % options['league_id'])
+        lines = export.FORMATS[options['format']](export.get_records(league))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                for line in lines:
+                    f.write(line)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management import call_command
+from django.db import connection
+from dgs import golden
+import json
+
+
+class Command(BaseCommand):
+    help = ("Loads the test data into an SQLite database, computes every event and league result and compares them, "
+            "field by field, against the golden snapshot. Run with --settings=dgscored.bench_settings.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--save', action='store_true', default=False, help="Save the computed results as the new golden snapshot instead of comparing.")
+        parser.add_argument('--testdata', default=golden.TESTDATA, help="Fixture to load. Defaults to %s." % golden.TESTDATA)
+        parser.add_argument('--golden', default=golden.GOLDEN, help="Golden snapshot file. Defaults to %s." % golden.GOLDEN)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("dgs_golden loads test data into the database, so only runs against SQLite. "
+                               "Use --settings=dgscored.bench_settings.")
+        call_command('migrate', interactive=False, verbosity=0)
+        call_command('createcachetable', verbosity=0)
+        golden.load_testdata(options['testdata'])
+        actual = json.loads(golden.dumps(golden.snapshot()))
+        if options['save']:
+            golden.save(actual, options['golden'])
+            self.stdout.write("Saved golden snapshot to %s" % options['golden'])
+            return
+        differences = golden.diff(golden.load(options['golden']), actual)
+        for difference in differences:
+            self.stdout.write(difference)
+        if differences:
+            raise CommandError("%s results differ from the golden snapshot" % len(differences))
+        self.stdout.write("Results match the golden snapshot")
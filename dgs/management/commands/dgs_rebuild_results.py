@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from dgs import models, changes
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the stored event results and league standings of all (or the given) leagues from scratch, "
+            "and invalidates what is cached of them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('league_ids', nargs='*', type=int, help="IDs of the leagues to rebuild. Defaults to all leagues.")
+
+    def handle(self, *args, **options):
+        leagues = models.League.objects.all()
+        if options['league_ids']:
+            leagues = leagues.filter(pk__in=options['league_ids'])
+        for league in leagues:
+            changes.apply({league.pk: None}, set(), {league.pk: None})
+            self.stdout.write("Rebuilt results for league %s: %s" % (league.pk, league))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from dgs import models, results
+import time
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the stored event results and league standings of all (or the given) leagues, sharding the "
+            "leagues across a pool of worker processes, and reports the time taken for each league.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('league_ids', nargs='*', type=int, help="IDs of the leagues to recompute. Defaults to all leagues.")
+        parser.add_argument('--processes', type=int, help="Number of worker processes. Defaults to the number of CPUs.")
+
+    def handle(self, *args, **options):
+        leagues = models.League.objects.all()
+        if options['league_ids']:
+            leagues = leagues.filter(pk__in=options['league_ids'])
+        # largest first, so that a big league isn't left running on its own at the end
+        leagues = list(leagues.annotate(size=Count('events__cards__scores')).order_by('-size', 'pk'))
+        by_pk = dict((league.pk, league) for league in leagues)
+        started = time.time()
+        league_time = 0
+        for league_pk, seconds in results.recompute([league.pk for league in leagues], processes=options['processes']):
+            league_time += seconds
+            self.stdout.write("Recomputed league %s: %s in %.2fs" % (league_pk, by_pk[league_pk], seconds))
+        self.stdout.write("Recomputed %s leagues in %.2fs (%.2fs of league time)" % (len(leagues), time.time() - started, league_time))
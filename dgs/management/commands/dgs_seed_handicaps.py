@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from dgs import models, results, changes
+
+
+class Command(BaseCommand):
+    help = ("Stores the initial handicap of each contestant of all (or the given) leagues who has played enough rounds "
+            "for a handicap but has none yet. This is also done whenever a league's results change, and is safe to repeat.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('league_ids', nargs='*', type=int, help="IDs of the leagues to seed. Defaults to all leagues.")
+
+    def handle(self, *args, **options):
+        leagues = models.League.objects.all()
+        if options['league_ids']:
+            leagues = leagues.filter(pk__in=options['league_ids'])
+        for league in leagues:
+            seeds = results.seed_initial_handicaps(league)
+            if seeds:
+                # stored without sending any signals, so apply the change to the league here
+                changes.apply({league.pk: None}, set(), {league.pk: None})
+            self.stdout.write("Seeded %s initial handicaps for league %s: %s" % (len(seeds), league.pk, league))
@@ -0,0 +1,10 @@
+from django.core.management.commands import loaddata
+from dgs.changes import batch_changes
+
+
+class Command(loaddata.Command):
+    help = loaddata.Command.help + " Changes to the league data are applied, and stored results refreshed, once all fixtures are loaded."
+
+    def handle(self, *fixture_labels, **options):
+        with batch_changes():
+            return super(Command, self).handle(*fixture_labels, **options)
@@ -0,0 +1,79 @@
+from django.utils.six.moves import cStringIO as StringIO
+from django.http import HttpResponse
+from django.db import connection
+from django.conf import settings
+from dgs import instrumentation
+import logging
+import cProfile
+import pstats
+import json
+
+logger = logging.getLogger('dgs.instrumentation')
+
+
+class InstrumentationMiddleware(object):
+    """
+    When settings.DGS_INSTRUMENTATION is True, records the SQL queries, cache hits and
+    misses and time spent computing results during each request (see
+    dgs.instrumentation), and logs them to the 'dgs.instrumentation' logger. Staff users
+    (or anyone, if DEBUG is on) also get them in X-DGS-* response headers. It is off by
+    default, since recording every query's SQL costs time on every request.
+
+    Staff users can add ?profile=1 to a URL to get a cProfile summary of the view
+    instead of its response.
+    """
+    def process_request(self, request):
+        if not getattr(settings, 'DGS_INSTRUMENTATION', False):
+            return
+        request._dgs_force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        if len(connection.queries_log) == connection.queries_log.maxlen:
+            connection.queries_log.clear()
+        # rather than clearing the log, which other observers of it may be reading from
+        request._dgs_queries_logged = len(connection.queries_log)
+        instrumentation.start()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.GET.get('profile') != '1' or not self.is_staff(request):
+            return None
+
+        def view():
+            response = view_func(request, *view_args, **view_kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+
+        profiler = cProfile.Profile()
+        profiler.runcall(view)
+        output = StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(50)
+        return HttpResponse(output.getvalue(), content_type='text/plain')
+
+    def process_response(self, request, response):
+        stats = instrumentation.stop()
+        if stats is None:
+            return response
+        connection.force_debug_cursor = getattr(request, '_dgs_force_debug_cursor', False)
+        record = stats.as_dict()
+        queries = list(connection.queries_log)[getattr(request, '_dgs_queries_logged', 0):]
+        record.update({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': len(queries),
+            'query_time': sum(float(query['time']) for query in queries),
+            })
+        logger.info(json.dumps(record, sort_keys=True))
+        if settings.DEBUG or self.is_staff(request):
+            response['X-DGS-Time'] = '%.1fms' % (record['time'] * 1000)
+            response['X-DGS-Queries'] = str(record['queries'])
+            response['X-DGS-Query-Time'] = '%.1fms' % (record['query_time'] * 1000)
+            response['X-DGS-Timings'] = ', '.join('%s=%s/%.1fms' % (name, timing['calls'], timing['time'] * 1000)
+                                                  for name, timing in sorted(record['timings'].items()))
+            response['X-DGS-Cache'] = ', '.join('%s=%s/%s' % (prefix, counts['hits'], counts['misses'])
+                                                for prefix, counts in sorted(record['cache'].items()))
+        return response
+
+    def is_staff(self, request):
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
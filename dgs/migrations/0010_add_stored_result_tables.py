@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dgs', '0009_add_per_league_hc_and_points_settings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventResultRow',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('position', models.IntegerField()),
+                ('rank', models.IntegerField()),
+                ('round_count', models.IntegerField()),
+                ('rounds_played', models.IntegerField()),
+                ('completed_event', models.BooleanField(default=False)),
+                ('scratch_score', models.IntegerField()),
+                ('previous_handicap', models.FloatField(null=True, blank=True)),
+                ('handicap', models.FloatField(null=True, blank=True)),
+                ('handicap_score', models.IntegerField(null=True, blank=True)),
+                ('points_earned', models.IntegerField(null=True, blank=True)),
+                ('awards', models.TextField(default=b'[]', blank=True)),
+                ('contestant', models.ForeignKey(to='dgs.Contestant')),
+                ('event', models.ForeignKey(to='dgs.Event')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeagueStandingRow',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('position', models.IntegerField()),
+                ('rank', models.IntegerField()),
+                ('points', models.IntegerField()),
+                ('handicap', models.FloatField(null=True, blank=True)),
+                ('initial_handicap', models.FloatField(null=True, blank=True)),
+                ('events_attended', models.IntegerField()),
+                ('rounds_played', models.IntegerField()),
+                ('valid_hc', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='leaguestandingrow',
+            name='league',
+            field=models.ForeignKey(to='dgs.League'),
+        ),
+        migrations.AddField(
+            model_name='leaguestandingrow',
+            name='player',
+            field=models.ForeignKey(to='dgs.Player'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='leaguestandingrow',
+            unique_together=set([('league', 'player')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='leaguestandingrow',
+            index_together=set([('league', 'position')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventresultrow',
+            unique_together=set([('event', 'contestant')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='eventresultrow',
+            index_together=set([('event', 'position')]),
+        ),
+    ]
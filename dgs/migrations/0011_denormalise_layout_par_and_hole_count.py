@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def update_layout_totals(apps, schema_editor):
+    Layout = apps.get_model('dgs', 'Layout')
+    for layout in Layout.objects.all():
+        totals = layout.holes.aggregate(par=models.Sum('par'), hole_count=models.Count('pk'))
+        layout.par = totals['par'] or 0
+        layout.hole_count = totals['hole_count']
+        layout.save(update_fields=['par', 'hole_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dgs', '0010_add_stored_result_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='layout',
+            name='hole_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='layout',
+            name='par',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(update_layout_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dgs', '0011_denormalise_layout_par_and_hole_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('namespace', models.CharField(unique=True, max_length=50)),
+                ('version', models.BigIntegerField(default=0)),
+                ('modified', models.DateTimeField(null=True, blank=True)),
+            ],
+        ),
+    ]
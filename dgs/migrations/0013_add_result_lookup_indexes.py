@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# Indexes on the auto-created many-to-many tables, led by the column their unique
+# (owner, target) index doesn't cover, so that looking up a score's cards, a card's
+# events, an event's leagues and so on is answered from the index alone.
+THROUGH_INDEXES = [
+    ('dgs_card_scores', ['score_id', 'card_id']),
+    ('dgs_event_cards', ['card_id', 'event_id']),
+    ('dgs_event_awards', ['award_id', 'event_id']),
+    ('dgs_league_events', ['event_id', 'league_id']),
+    ('dgs_league_contestants', ['contestant_id', 'league_id']),
+]
+
+
+def get_through_indexes():
+    for table, columns in THROUGH_INDEXES:
+        yield table, columns, '%s_%s_covering' % (table, columns[0][:-len('_id')])
+
+
+def add_through_indexes(apps, schema_editor):
+    for table, columns, name in get_through_indexes():
+        schema_editor.execute('CREATE INDEX %s ON %s (%s)' % (name, table, ', '.join(columns)))
+
+
+def remove_through_indexes(apps, schema_editor):
+    for table, columns, name in get_through_indexes():
+        # MySQL drops an index from its table, the others by name alone
+        if schema_editor.connection.vendor == 'mysql':
+            schema_editor.execute('DROP INDEX %s ON %s' % (name, table))
+        else:
+            schema_editor.execute('DROP INDEX %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dgs', '0012_add_data_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='card',
+            name='date',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='date',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='score',
+            index_together=set([('contestant', 'date')]),
+        ),
+        migrations.RunPython(add_through_indexes, remove_through_indexes),
+    ]
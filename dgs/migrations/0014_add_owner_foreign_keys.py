@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# (owner model, many-to-many field, owned model), the owned model's foreign key being
+# named after the owner model
+OWNERS = [
+    ('card', 'scores', 'score'),
+    ('event', 'cards', 'card'),
+    ('league', 'events', 'event'),
+]
+
+
+def backfill_owners(apps, schema_editor):
+    for owner, field_name, owned in OWNERS:
+        through = apps.get_model('dgs', owner)._meta.get_field(field_name).rel.through
+        # the first owner of each owned object, as dgs.models.update_owners() picks
+        owners = {}
+        for owner_pk, owned_pk in through.objects.order_by('-' + owner).values_list(owner, owned):
+            owners[owned_pk] = owner_pk
+        owned_pks = defaultdict(list)
+        for owned_pk, owner_pk in owners.items():
+            owned_pks[owner_pk].append(owned_pk)
+        for owner_pk, pks in owned_pks.items():
+            apps.get_model('dgs', owned).objects.filter(pk__in=pks).update(**{owner: owner_pk})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dgs', '0013_add_result_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='event',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='dgs.Event', null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='league',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='dgs.League', null=True),
+        ),
+        migrations.AddField(
+            model_name='score',
+            name='card',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='dgs.Card', null=True),
+        ),
+        # only the related names change, but SQLite would remake the through tables without
+        # the indexes added to them in 0013
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='card',
+                name='scores',
+                field=models.ManyToManyField(related_name='card_set', to='dgs.Score', blank=True),
+            ),
+            migrations.AlterField(
+                model_name='event',
+                name='cards',
+                field=models.ManyToManyField(related_name='event_set', to='dgs.Card', blank=True),
+            ),
+            migrations.AlterField(
+                model_name='league',
+                name='events',
+                field=models.ManyToManyField(related_name='league_set', to='dgs.Event', blank=True),
+            ),
+        ]),
+        migrations.RunPython(backfill_owners, migrations.RunPython.noop),
+    ]
@@ -2,9 +2,19 @@ from collections import OrderedDict, defaultdict
 from django.db.models import signals
 from django.core.cache import cache
 from django.utils import timezone
+from dgs.cache import get_version, league_namespace
+from dgs.snapshot import LeagueSnapshot
+from dgs.handicap import HandicapEngine
+from dgs.instrumentation import timed
+from dgs import ranking
 from dgscored import settings
 from django.db import models
+from django.db.models import Prefetch, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Concat
+from django.db.models.query import prefetch_related_objects
 import pytz
+import json
 
 timezone.activate(pytz.timezone(settings.TIME_ZONE))
 current_tz = timezone.get_current_timezone()
@@ -41,16 +51,11 @@ class Player(models.Model):
         Returns first name if unique, else first_name + last_name_initial if unique,
         else first_name + last name
         """
-        same_first_names = Player.objects.filter(first_name__iexact=self.first_name)
-        if len(same_first_names) == 1:
-            return self.first_name
-        else:
-            same_last_name_initial = defaultdict(int)
-            for player in same_first_names:
-                same_last_name_initial[player.last_name_initial] += 1
-            if same_last_name_initial[self.last_name_initial] == 1:
-                return "%s %s" % (self.first_name, self.last_name_initial)
-        return self.full_name
+        from dgs import names
+        shortest_names = names.get_shortest_names()
+        if self.pk not in shortest_names:
+            shortest_names = names.load_shortest_names()
+        return shortest_names.get(self.pk, self.full_name)
 
     def __unicode__(self):
         return self.full_name
@@ -82,17 +87,28 @@ class Hole(models.Model):
 class Layout(models.Model):
     name = models.CharField(max_length=50)
     holes = models.ManyToManyField(Hole)
-
-    @property
-    def par(self):
-        return sum([h.par for h in self.holes.all()])
+    # totals of holes, kept up to date by update_totals() when holes change
+    par = models.IntegerField(default=0, editable=False)
+    hole_count = models.IntegerField(default=0, editable=False)
 
     def __unicode__(self):
         return "%s (Par %s)" % (self.name, self.par)
 
-    @property
-    def hole_count(self):
-        return self.holes.count()
+    @staticmethod
+    def update_totals(layout_pks):
+        """
+        Recalculates the stored par and hole count of the given layouts from their holes.
+        """
+        for layout_pk in layout_pks:
+            totals = Hole.objects.filter(layout=layout_pk).aggregate(par=models.Sum('par'), hole_count=models.Count('pk'))
+            Layout.objects.filter(pk=layout_pk).update(par=totals['par'] or 0, hole_count=totals['hole_count'])
+
+    def refresh_totals(self):
+        """
+        Recalculates this layout's stored par and hole count, updating this instance too.
+        """
+        Layout.update_totals([self.pk])
+        self.par, self.hole_count = Layout.objects.filter(pk=self.pk).values_list('par', 'hole_count').get()
 
 
 class Course(models.Model):
@@ -110,6 +126,11 @@ class Score(models.Model):
     contestant = models.ForeignKey(Contestant)
     strokes = models.IntegerField(blank=True, null=True)
     date = models.DateTimeField()
+    # the card this score is on, kept up to date from Card.scores by update_owners()
+    card = models.ForeignKey('Card', blank=True, null=True, editable=False, on_delete=models.SET_NULL, related_name='+')
+
+    class Meta:
+        index_together = (('contestant', 'date'),)
 
     def __unicode__(self):
         return "%s - %s - %s" % (self.strokes or "DNF", normalise(self.date).ctime(), self.contestant.player.name)
@@ -118,8 +139,10 @@ class Score(models.Model):
 class Card(models.Model):
     course = models.ForeignKey(Course)
     layout = models.ForeignKey(Layout)
-    date = models.DateTimeField()
-    scores = models.ManyToManyField(Score, blank=True)
+    date = models.DateTimeField(db_index=True)
+    scores = models.ManyToManyField(Score, blank=True, related_name='card_set')
+    # the event this card is in, kept up to date from Event.cards by update_owners()
+    event = models.ForeignKey('Event', blank=True, null=True, editable=False, on_delete=models.SET_NULL, related_name='+')
 
     @property
     def players(self, render=True):
@@ -127,7 +150,9 @@ class Card(models.Model):
         Returns a list of Players who are competing on this card
         Returns a string if render=True, else a list of Player objects.
         """
-        result = [s.contestant.player.shortest_name for s in self.scores.all()]
+        from dgs import names
+        shortest_names = names.get_shortest_names()
+        result = [shortest_names.get(s.contestant.player_id) or s.contestant.player.shortest_name for s in self.scores.all()]
         if render:
             return ", ".join(result)
         return result
@@ -139,6 +164,7 @@ class Card(models.Model):
         return normalise(self.date).strftime("%a %b %d %H:%M, %Y")
 
     @property
+    @timed('card_result')
     def result(self):
         result = OrderedDict()
         for score in self.scores.all():
@@ -156,11 +182,19 @@ class Card(models.Model):
         result = OrderedDict(sorted(result.iteritems(), key=lambda x: x[1]["scratch_score"]))
         return result
 
+    def with_scores(self):
+        """
+        Loads this card's scores with their contestants and players in one query, for
+        rendering them, and returns this card.
+        """
+        prefetch_related_objects([self], [Prefetch('scores', queryset=Score.objects.select_related('contestant__player').order_by('pk'))])
+        return self
+
     def completed(self, contestant):
-        if contestant not in [s.contestant for s in self.scores.all()]:
+        strokes = [s.strokes for s in self.scores.all() if s.contestant_id == contestant.pk]
+        if not strokes:
             return None
-        dnf_contestants = [s.contestant for s in self.scores.filter(strokes=None)]
-        if contestant in dnf_contestants:
+        if None in strokes:
             return False
         return True
 
@@ -181,28 +215,30 @@ class Event(models.Model):
     Generic event model, eg. a league day
     """
     name = models.CharField(max_length=50, blank=True, null=True, help_text="Name of event, eg 'September League Day'")
-    date = models.DateTimeField()
+    date = models.DateTimeField(db_index=True)
     rounds = models.IntegerField(help_text="Number of rounds that players are required to complete during this league event")
     awards = models.ManyToManyField(Award, blank=True)
-    cards = models.ManyToManyField(Card, blank=True)
+    cards = models.ManyToManyField(Card, blank=True, related_name='event_set')
+    # the league this event is in, kept up to date from League.events by update_owners()
+    league = models.ForeignKey('League', blank=True, null=True, editable=False, on_delete=models.SET_NULL, related_name='+')
+
+    def get_snapshot(self):
+        """
+        Returns the LeagueSnapshot this Event was loaded from, or a snapshot of its League.
+        """
+        snapshot = getattr(self, '_snapshot', None)
+        if snapshot is None:
+            # not self.league, which is stale if this was added to it by League.events.add()
+            snapshot = League.objects.get(pk__in=Event.objects.filter(pk=self.pk).values('league')).get_snapshot()
+        return snapshot
 
     def get_latest_cards(self, contestant, n=1):
         """
-        returns up to n latest score cards for contestant, sorted 
-        """
-        result = []
-        all_events = self.league_set.get().events.filter(date__lte=self.date)
-        for event in all_events:
-            cards = event.cards.all()
-            for card in cards:
-                if card.scores.filter(contestant=contestant):
-                    if card.completed(contestant):
-                        # this card counts
-                        result.append(card)
-        result = sorted(result, key=lambda x: x.date, reverse=True)[:n]
-        result = [int(c.result[contestant]['scratch_delta']) for c in result]
-        result = sorted(result)
-        return result
+        returns the scratch deltas of up to n latest completed score cards for contestant
+        as at this event, sorted
+        """
+        latest_cards = self.get_snapshot().get_card_index().latest(contestant.pk, self.date, n)
+        return sorted(completed_card.scratch_delta for completed_card in latest_cards)
 
     @property
     def render_date(self):
@@ -215,112 +251,87 @@ class Event(models.Model):
         did not complete Event.rounds rounds, then they earned minimum points for
         attendance, eg one point.
         """
-        league_points = self.league_set.get().get_league_points()
+        league_points = self.get_snapshot().league.get_league_points()
         if 0 > rank or rank >= len(league_points):
             return league_points[-1]
         return league_points[rank]
 
     @staticmethod
     def get_previous_handicap(event, contestant):
-        try:
-            previous_event = event.get_previous_by_date()
-        except event.DoesNotExist:
-            return contestant.initial_handicap
-        try:
-            return previous_event.get_result(for_contestant=contestant)[contestant]['handicap']
-        except KeyError:
-            # contestant did not compete in previous event, check the next previous
-            return Event.get_previous_handicap(previous_event, contestant)
+        snapshot = event.get_snapshot()
+        handicaps = snapshot.league.get_handicaps()
+        previous_handicap = snapshot.contestants.get(contestant.pk, contestant).initial_handicap
+        for event_pk, event_handicaps in handicaps.items():
+            if event_pk == event.pk:
+                break
+            if contestant.pk in event_handicaps:
+                previous_handicap = event_handicaps[contestant.pk]['handicap']
+        return previous_handicap
+
+    @property
+    def last_card(self):
+        cards = list(self.cards.all())
+        return cards and cards[-1] or None
 
     @property
     def result(self):
         return self.get_result()
 
+    @timed('event_result')
     def get_result(self, for_contestant=None):
         """
         Returns a per-player results dict including points earned by contestants during this event, ordered by rank.
         Returns result for specified for_contestant or all if None.
         """
-        league = self.league_set.get()
-        event_result = {}
+        snapshot = self.get_snapshot()
+        event = snapshot.get_event(self.pk)
+        if event is not self:
+            return event.get_result(for_contestant=for_contestant)
+        league = snapshot.league
+        awards = defaultdict(list)
+        for award in self.awards.all():
+            awards[award.contestant_id].append(award.name)
+        rows = {}
         for card in self.cards.all():
             card_result = card.result
             for contestant in card_result:
                 if for_contestant and contestant != for_contestant:
                     continue
-                if not contestant in event_result:
-                    event_result[contestant] = defaultdict(int)
-                event_result[contestant]['awards'] = [a.name for a in self.awards.filter(contestant=contestant)]
+                row = rows.get(contestant)
+                if row is None:
+                    row = rows[contestant] = ranking.EventRow(contestant, awards[contestant.pk])
                 if card.completed(contestant):
-                    event_result[contestant]['round_count'] += 1
-                event_result[contestant]['completed_event'] = event_result[contestant]['round_count'] >= self.rounds 
+                    row.round_count += 1
+                row.completed_event = row.round_count >= self.rounds
                 # only count a scratch score if the contestant has not exceeded the max number of rounds required in this event.
-                if event_result[contestant]['round_count'] <= self.rounds and card_result[contestant]['scratch_score'] != "DNF":
-                    event_result[contestant]['scratch_score'] += card_result[contestant]['scratch_score']
-        for contestant in event_result:
+                if row.round_count <= self.rounds and card_result[contestant]['scratch_score'] != "DNF":
+                    row.scratch_score += card_result[contestant]['scratch_score']
+        handicaps = league.get_handicaps()[self.pk]
+        for contestant, row in rows.items():
             # calculate handicap score
-            previous_handicap = Event.get_previous_handicap(self, contestant)
-            if previous_handicap == None:
-                event_result[contestant]['previous_handicap'] = None
-                event_result[contestant]['handicap_score'] = None
-            else:
-                event_result[contestant]['previous_handicap'] = previous_handicap
-                event_result[contestant]['handicap_score'] = int(event_result[contestant]['scratch_score'] - \
-                        (round(previous_handicap) * event_result[contestant]['round_count']))
-            # calculate new handicap
-            latest_n_results = self.get_latest_cards(contestant, league.handicap_max_rounds_avg)
-            # calculate average:
-            best_scratch_deltas = latest_n_results[:league.handicap_min_rounds_avg]
-            if not best_scratch_deltas:
-                event_result[contestant]['handicap'] = previous_handicap
-            else:
-                handicap = reduce(lambda x, y: float(x) + float(y), best_scratch_deltas) / len(best_scratch_deltas)
-                # round to 2 decimal places
-                handicap = round(handicap * league.handicap_multiplier, 2)
-                event_result[contestant]['handicap'] = handicap
-                # inject the handicap into the contestant's initial handicap value if they played the required number of rounds
-                total_rounds = sum([sum([c.scores.filter(contestant=contestant).count() for c in e.cards.all()]) for e in self.league_set.last().events.all()])
-                if contestant.initial_handicap == None and total_rounds == league.handicap_min_rounds:
-                    contestant.initial_handicap = handicap
-                    contestant.save()
-
-        # sort event_result by players who completed all required rounds, then by handicap score, then by scratch score
-        # group first
-        result = {}
-        incomplete_result = {}
-        no_hc_result = {}
-        # sort groups
-        for contestant in event_result:
-            if event_result[contestant]["handicap_score"] == None:
-                no_hc_result[contestant] = event_result[contestant]
-            elif not event_result[contestant]['completed_event']:
-                incomplete_result[contestant] = event_result[contestant]
-            else:
-                result[contestant] = event_result[contestant]
-        result = OrderedDict(sorted(result.iteritems(), key=lambda x: x[1]["handicap_score"]))
-        incomplete_result = OrderedDict(sorted(incomplete_result.iteritems(), key=lambda x: (-x[1]["round_count"], x[1]["handicap_score"])))
-        no_hc_result = OrderedDict(sorted(no_hc_result.iteritems(), key=lambda x: x[1]["scratch_score"]))
-        # aggregate into a single result dict
-        incomplete_result.update(no_hc_result)
-        result.update(incomplete_result)
-        event_result = result
-        # add rank data
-        rank = 0
-        for contestant in event_result:
-            index = event_result.keys().index(contestant)
-            if index > 0 and (event_result[event_result.keys()[index - 1]]['handicap_score'] != (event_result[contestant]['handicap_score'] or 0)):
-                rank = index
-            event_result[contestant]['rank'] = rank + 1
-        # assign points earned
-        for contestant in event_result:
-            if event_result[contestant]['handicap_score'] == None:
-                event_result[contestant]['points_earned'] = None
-            elif event_result[contestant]['round_count'] < self.rounds:
-                # player completed less than the required rounds, assign minimum possible points. 
-                event_result[contestant]['points_earned'] = self.get_points(-1)
-            else:
-                event_result[contestant]['points_earned'] = self.get_points(event_result[contestant]["rank"] - 1)
-        return event_result
+            row.previous_handicap = handicaps[contestant.pk]['previous_handicap']
+            if row.previous_handicap is not None:
+                row.handicap_score = int(row.scratch_score - (round(row.previous_handicap) * row.round_count))
+            row.handicap = handicaps[contestant.pk]['handicap']
+        ranked = ranking.rank_event(rows.values(), self.rounds, league.get_league_points())
+        return OrderedDict((row.contestant, row.as_dict()) for row in ranked)
+
+    def get_rounds_played(self):
+        """
+        Returns a dict of contestant pk to the number of cards they have a score on in this event.
+        """
+        rounds_played = defaultdict(int)
+        for card in self.cards.all():
+            for score in card.scores.all():
+                rounds_played[score.contestant_id] += 1
+        return rounds_played
+
+    @property
+    def stored_result(self):
+        """
+        Returns the event result as last stored in EventResultRow, see dgs.results.
+        """
+        return OrderedDict((row.contestant, row.stats) for row in self.eventresultrow_set.select_related('contestant__player').order_by('position'))
 
     def __unicode__(self):
         name = self.name or "Event"
@@ -330,7 +341,7 @@ class Event(models.Model):
 class League(models.Model):
     name = models.CharField(max_length=50)
     contestants = models.ManyToManyField(Contestant, blank=True)
-    events = models.ManyToManyField(Event, blank=True)
+    events = models.ManyToManyField(Event, blank=True, related_name='league_set')
     league_points = models.CharField(verbose_name="League Points Assignment", max_length=50, default="10,9,8,7,6,5,4,3,2,1", help_text="""
 Points assignments for league event ranking (based on HC adjusted total score).
 Index of list is rank, value is points earned. Last element of list is used as the
@@ -359,43 +370,342 @@ The number of past cards to consider when chosing the best cards for a player fo
     def get_league_points(self):
         return [int(p.strip()) for p in self.league_points.split(',')]
 
+    def get_snapshot(self):
+        """
+        Returns a LeagueSnapshot of this league, loaded once per League instance.
+        """
+        if not hasattr(self, '_snapshot'):
+            self._snapshot = LeagueSnapshot(self)
+        return self._snapshot
+
+    def get_events(self):
+        """
+        Returns this league's events with their cards but not their scores, in the order of
+        get_snapshot().events, loaded once per League instance. For laying out pages whose
+        results are rendered from cache.
+        """
+        if not hasattr(self, '_events'):
+            self._events = list(self.events.order_by('pk').prefetch_related(
+                Prefetch('cards', queryset=Card.objects.select_related('course', 'layout').order_by('pk'))))
+        return self._events
+
+    def get_handicaps(self):
+        """
+        Returns the previous and resulting handicap of every contestant at every event in this
+        league, as calculated by HandicapEngine. Cached until the next change to this league.
+        """
+        return self.get_handicaps_and_seeds()[0]
+
+    def get_initial_handicap_seeds(self):
+        """
+        Returns a dict of Contestant pk to the initial handicap seeded for each of this league's
+        contestants who has played enough rounds for a handicap but has no initial handicap
+        stored yet, see dgs.results.seed_initial_handicaps().
+        """
+        return self.get_handicaps_and_seeds()[1]
+
+    def get_handicaps_and_seeds(self):
+        cache_key = 'league_handicaps_%s' % self.pk
+        version = get_version(league_namespace(self.pk))
+        handicaps_and_seeds = cache.get(cache_key, version=version)
+        if handicaps_and_seeds is None:
+            handicaps_and_seeds = HandicapEngine(self.get_snapshot()).run()
+            cache.set(cache_key, handicaps_and_seeds, None, version=version)
+        # results are computed as if the seeds were stored, whether or not they are yet
+        for pk, initial_handicap in handicaps_and_seeds[1].items():
+            contestant = self.get_snapshot().contestants.get(pk)
+            if contestant is not None and contestant.initial_handicap is None:
+                contestant.initial_handicap = initial_handicap
+        return handicaps_and_seeds
+
     @property
+    @timed('league_result')
     def result(self):
+        event_results = []
+        for event in self.get_snapshot().events:
+            rounds_played = event.get_rounds_played()
+            for contestant, stats in event.result.items():
+                event_results.append((contestant, stats, rounds_played[contestant.pk]))
+        return self.get_standings(event_results)
+
+    @property
+    def stored_result(self):
+        """
+        Returns the league standings as last stored in LeagueStandingRow, see dgs.results.
+        """
+        return OrderedDict((row.player, row.stats) for row in self.leaguestandingrow_set.select_related('player').order_by('position'))
+
+    def get_standings(self, event_results):
+        """
+        Returns league standings aggregated from a list of (contestant, event result stats, rounds played)
+        tuples, ordered by event then by event rank.
+        """
         standings = OrderedDict()
-        for event in self.events.all():
-            result = event.result
-            for contestant in result:
-                player = contestant.player
-                if not player in standings:
-                    standings[player] = defaultdict(int)
-                standings[player]['initial_handicap'] = contestant.initial_handicap
-                standings[player]['points'] += result[contestant]['points_earned'] or 0
-                standings[player]['handicap'] = result[contestant]['handicap']
-                standings[player]['events_attended'] += 1 
-                standings[player]['rounds_played'] += sum([c.scores.filter(contestant=contestant).count() for c in event.cards.all()])
-        # flag playeres who have not completed enough rounds to be ranked
-        for player in standings:
-            if standings[player]['initial_handicap'] == None and standings[player]['rounds_played'] < self.handicap_min_rounds:
-                standings[player]['valid_hc'] = False
-            else:
-                standings[player]['valid_hc'] = True
-
-        # add rank data
-        standings = OrderedDict(sorted(standings.iteritems(), key=lambda x: x[1]['points'], reverse=True))
-        rank = 0
-        for player in standings:
-            index = standings.keys().index(player)
-            if index > 0 and (standings[standings.keys()[index - 1]]['points'] != standings[player]['points']):
-                rank = index
-            standings[player]['rank'] = rank + 1
-        # sort by rank
-        standings = OrderedDict(sorted(standings.iteritems(), key=lambda x: x[1]['rank']))
-        return standings
+        for contestant, result, rounds_played in event_results:
+            player = contestant.player
+            row = standings.get(player)
+            if row is None:
+                row = standings[player] = ranking.StandingRow(player)
+            row.initial_handicap = contestant.initial_handicap
+            row.points += result['points_earned'] or 0
+            row.handicap = result['handicap']
+            row.events_attended += 1
+            row.rounds_played += rounds_played
+        for row in standings.values():
+            # flag players who have not completed enough rounds to be ranked
+            row.valid_hc = row.initial_handicap is not None or row.rounds_played >= self.handicap_min_rounds
+        return OrderedDict((row.player, row.as_dict()) for row in ranking.rank_standings(standings.values()))
+
+
+class EventResultRow(models.Model):
+    """
+    A stored row of Event.get_result() for one contestant. Maintained by dgs.results.
+    """
+    event = models.ForeignKey(Event)
+    contestant = models.ForeignKey(Contestant)
+    position = models.IntegerField()
+    rank = models.IntegerField()
+    round_count = models.IntegerField()
+    rounds_played = models.IntegerField()
+    completed_event = models.BooleanField(default=False)
+    scratch_score = models.IntegerField()
+    previous_handicap = models.FloatField(blank=True, null=True)
+    handicap = models.FloatField(blank=True, null=True)
+    handicap_score = models.IntegerField(blank=True, null=True)
+    points_earned = models.IntegerField(blank=True, null=True)
+    awards = models.TextField(blank=True, default="[]")
+
+    class Meta:
+        unique_together = (('event', 'contestant'),)
+        index_together = (('event', 'position'),)
+
+    @property
+    def stats(self):
+        return {
+                'awards': json.loads(self.awards),
+                'round_count': self.round_count,
+                'completed_event': self.completed_event,
+                'scratch_score': self.scratch_score,
+                'previous_handicap': self.previous_handicap,
+                'handicap_score': self.handicap_score,
+                'handicap': self.handicap,
+                'rank': self.rank,
+                'points_earned': self.points_earned,
+                }
+
+    def __unicode__(self):
+        return "%s - %s: %s" % (self.event, self.contestant.player.name, self.rank)
+
+
+class LeagueStandingRow(models.Model):
+    """
+    A stored row of League.result for one player. Maintained by dgs.results.
+    """
+    league = models.ForeignKey(League)
+    player = models.ForeignKey(Player)
+    position = models.IntegerField()
+    rank = models.IntegerField()
+    points = models.IntegerField()
+    handicap = models.FloatField(blank=True, null=True)
+    initial_handicap = models.FloatField(blank=True, null=True)
+    events_attended = models.IntegerField()
+    rounds_played = models.IntegerField()
+    valid_hc = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = (('league', 'player'),)
+        index_together = (('league', 'position'),)
+
+    @property
+    def stats(self):
+        return {
+                'initial_handicap': self.initial_handicap,
+                'points': self.points,
+                'handicap': self.handicap,
+                'events_attended': self.events_attended,
+                'rounds_played': self.rounds_played,
+                'valid_hc': self.valid_hc,
+                'rank': self.rank,
+                }
+
+    def __unicode__(self):
+        return "%s - %s: %s" % (self.league, self.player.name, self.rank)
+
+
+class DataVersion(models.Model):
+    """
+    A counter per cache namespace (see dgs.cache), incremented along with its modified
+    time whenever the data in the namespace changes. Used for ETag and Last-Modified headers.
+    The GLOBAL_NAMESPACE counter is incremented on any change to the league data.
+    """
+    namespace = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+    modified = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def etag(self):
+        return '%s-%s' % (self.namespace, self.version)
+
+    @classmethod
+    def get(cls, namespace):
+        """
+        Returns the DataVersion of namespace, or an unsaved one at version 0 if nothing in
+        it has changed yet.
+        """
+        try:
+            return cls.objects.get(namespace=namespace)
+        except cls.DoesNotExist:
+            return cls(namespace=namespace)
+
+    @classmethod
+    def get_for_league(cls, league_pk):
+        """
+        Returns the DataVersion of the namespace of the league whose pk is selected by
+        league_pk, a values() queryset of at most one row, looking up the league in the same
+        query. Returns None if there is no such league or nothing in it has changed yet.
+        """
+        league_pk = RawSQL(*league_pk.query.sql_with_params())
+        namespace = Concat(Value(league_namespace('')), league_pk, output_field=models.CharField())
+        return cls.objects.filter(namespace=namespace).first()
+
+    @classmethod
+    def get_for_event_league(cls, event_pk):
+        """
+        Returns the DataVersion of the namespace of the league of the Event with event_pk,
+        as get_for_league().
+        """
+        return cls.get_for_league(Event.objects.filter(pk=event_pk).values('league'))
+
+    @classmethod
+    def get_for_contestant_league(cls, contestant_pk):
+        """
+        Returns the DataVersion of the namespace of the first league of the Contestant with
+        contestant_pk, as get_for_league().
+        """
+        return cls.get_for_league(League.objects.filter(contestants=contestant_pk).order_by('pk').values('pk')[:1])
+
+    @classmethod
+    def bump(cls, namespaces):
+        now = timezone.now()
+        for namespace in namespaces:
+            if not cls.objects.filter(namespace=namespace).update(version=models.F('version') + 1, modified=now):
+                data_version, created = cls.objects.get_or_create(namespace=namespace, defaults={'version': 1, 'modified': now})
+                if not created:
+                    # created by someone else in the meantime
+                    cls.objects.filter(namespace=namespace).update(version=models.F('version') + 1, modified=now)
+
+    def __unicode__(self):
+        return "%s: %s" % (self.namespace, self.version)
+
 
+# models whose changes affect the stored EventResultRow and LeagueStandingRow tables
+RESULT_SOURCES = (League, Event, Contestant, Card, Award, Score, Layout, Hole)
+# the many-to-many relations whose targets keep a foreign key to their owner, by through
+# model: (owner field, target model, target field)
+OWNED_BY = {
+    Card.scores.through: ('card', Score, 'score'),
+    Event.cards.through: ('event', Card, 'card'),
+    League.events.through: ('league', Event, 'event'),
+    }
 
-def model_change_handler(sender, instance, **kwargs):
-    # Model changed, invalidate cache. Next view will be a lengthy recalculation to re-populate our cache.
-    cache.clear() 
+
+def update_owners(through, pks):
+    """
+    Points the owner foreign key of each of the objects with pks, the targets of the
+    many-to-many relation through, at the first owner they are related to, or at None.
+    Returns a dict of their pks to their owners' pks.
+    """
+    owner, model, target = OWNED_BY[through]
+    owners = {}
+    for pk in pks:
+        owners[pk] = through.objects.filter(**{target: pk}).order_by(owner).values_list(owner, flat=True).first()
+        model.objects.filter(pk=pk).update(**{owner: owners[pk]})
+    return owners
+
+
+def refresh_owner(instance):
+    """
+    Re-derives the owner foreign key of instance, a Score, Card or Event, updating instance too.
+    """
+    for through, (owner, model, target) in OWNED_BY.items():
+        if isinstance(instance, model):
+            setattr(instance, owner + '_id', update_owners(through, [instance.pk])[instance.pk])
+
+
+# models whose changes affect what is cached for a league
+CACHE_SOURCES = RESULT_SOURCES + (Player, Course)
+
+
+def model_change_handler(sender, instance, relations_only=False, **kwargs):
+    if sender not in CACHE_SOURCES:
+        # eg. sessions, auth, admin log entries and the stored result rows
+        return
+    from dgs import invalidation, results, names, changes
+    if sender is Hole:
+        Layout.update_totals(instance.__dict__.pop('_layout_pks', None) or instance.layout_set.values_list('pk', flat=True))
+    elif sender is Layout and kwargs.get('signal') is signals.post_save:
+        # don't let a save of a stale instance overwrite the totals
+        instance.refresh_totals()
+    elif sender in (Score, Card, Event) and kwargs.get('signal') is signals.post_save and not kwargs.get('created'):
+        # nor its owner
+        refresh_owner(instance)
+    if kwargs.get('created') and sender in (Score, Card, Award):
+        # not on a card or in an event yet, being added to one is a change of its own
+        affected, affected_cards = {}, set()
+    else:
+        affected = results.get_affected_leagues(instance, instance.__dict__.pop('_affected_leagues', {}), relations_only)
+        affected_cards = invalidation.get_affected_cards(instance, instance.__dict__.pop('_affected_cards', set()))
+    if sender is Player:
+        # a change to one player's name can change the shortest names of others
+        for player in Player.objects.filter(pk__in=names.refresh()).exclude(pk=instance.pk):
+            results.get_affected_leagues(player, affected)
+            invalidation.get_affected_cards(player, affected_cards)
+    # Model changed, invalidate the cached leagues, events and cards that depend on it. Next
+    # view of those will be a recalculation to re-populate our cache.
+    batch = changes.current()
+    if batch is not None:
+        # the stored results are refreshed at the end of the batch, by when fixtures
+        # loaded raw are complete
+        batch.add(affected, affected_cards, sender in RESULT_SOURCES)
+    elif sender in RESULT_SOURCES and not kwargs.get('raw'):
+        changes.apply(affected, affected_cards, affected)
+    else:
+        changes.apply(affected, affected_cards, {})
+
+
+def model_pre_change_handler(sender, instance, relations_only=False, **kwargs):
+    # remember what instance belongs to before its relations are removed
+    if sender in CACHE_SOURCES:
+        from dgs import invalidation, results
+        instance._affected_leagues = results.get_affected_leagues(instance, relations_only=relations_only)
+        instance._affected_cards = invalidation.get_affected_cards(instance)
+        if sender is Hole:
+            instance._layout_pks = list(instance.layout_set.values_list('pk', flat=True))
+
+
+def m2m_change_handler(sender, instance, action, **kwargs):
+    if action in ('pre_remove', 'pre_clear'):
+        model_pre_change_handler(instance.__class__, instance, relations_only=True)
+        if action == 'pre_clear' and sender in OWNED_BY and not kwargs['reverse']:
+            owner, model, target = OWNED_BY[sender]
+            instance._owned_pks = list(sender.objects.filter(**{owner: instance.pk}).values_list(target, flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if sender in OWNED_BY:
+            owner, model, target = OWNED_BY[sender]
+            if kwargs['reverse']:
+                # for owned objects, pk_set is the owners added or removed
+                refresh_owner(instance)
+            else:
+                update_owners(sender, kwargs['pk_set'] or instance.__dict__.pop('_owned_pks', []))
+        if sender is Layout.holes.through:
+            # for holes, pk_set is the layouts added or removed, and is None when cleared
+            if isinstance(instance, Layout):
+                instance.refresh_totals()
+            else:
+                Layout.update_totals(kwargs['pk_set'] or instance.__dict__.pop('_layout_pks', []))
+        model_change_handler(instance.__class__, instance, relations_only=True)
 
 signals.post_save.connect(model_change_handler)
 signals.post_delete.connect(model_change_handler)
+signals.pre_delete.connect(model_pre_change_handler)
+signals.m2m_changed.connect(m2m_change_handler)
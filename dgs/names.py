@@ -0,0 +1,65 @@
+"""
+The shortest unambiguous name of every player, as shown on cards.
+
+The names of all players are worked out together from a single query and cached,
+and recomputed whenever a Player is saved or deleted. Since one player's name can
+change another's shortest name (eg. a second "Bob" turns "Bob" into "Bob J"),
+refresh() reports which players' shortest names changed so that anything showing
+them can be invalidated.
+"""
+from django.core.cache import cache
+from collections import defaultdict
+from dgs import models
+
+CACHE_KEY = 'player_shortest_names'
+
+
+def compute_shortest_names(players):
+    """
+    Returns a dict of pk to shortest name for the given (pk, first_name, last_name) tuples.
+    A player's shortest name is their first name if unique, else their first name and last
+    name initial if unique among players with the same first name, else their full name.
+    Players without a last name are shown by their first name.
+    """
+    players = list(players)
+    by_first_name = defaultdict(list)
+    for pk, first_name, last_name in players:
+        by_first_name[first_name.lower()].append(last_name[:1])
+    names = {}
+    for pk, first_name, last_name in players:
+        last_name_initials = by_first_name[first_name.lower()]
+        if len(last_name_initials) == 1 or not last_name:
+            names[pk] = first_name
+        elif last_name_initials.count(last_name[0]) == 1:
+            names[pk] = "%s %s" % (first_name, last_name[0])
+        else:
+            names[pk] = "%s %s" % (first_name, last_name)
+    return names
+
+
+def load_shortest_names():
+    return compute_shortest_names(models.Player.objects.values_list('pk', 'first_name', 'last_name'))
+
+
+def get_shortest_names():
+    """
+    Returns a dict of the pk of every player to their shortest name.
+    """
+    names = cache.get(CACHE_KEY)
+    if names is None:
+        names = load_shortest_names()
+        cache.set(CACHE_KEY, names, None)
+    return names
+
+
+def refresh():
+    """
+    Recomputes the cached shortest names, returning the pks of the players whose shortest
+    name changed (or of every player, if the previous names are no longer cached).
+    """
+    previous = cache.get(CACHE_KEY)
+    names = load_shortest_names()
+    cache.set(CACHE_KEY, names, None)
+    if previous is None:
+        return set(names)
+    return set(pk for pk in set(previous) | set(names) if previous.get(pk) != names.get(pk))
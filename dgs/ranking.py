@@ -0,0 +1,109 @@
+"""
+Ranking of event results and league standings.
+
+Results are built up as compact row objects, one per contestant (or player), which
+are then grouped, sorted once per group and ranked in a single pass. Competition
+ranking is used ("1224"), so tied rows share a rank and the next rank is skipped.
+"""
+
+
+class EventRow(object):
+    """
+    A contestant's result in an event.
+    """
+    __slots__ = ('contestant', 'awards', 'round_count', 'completed_event', 'scratch_score',
+                 'previous_handicap', 'handicap_score', 'handicap', 'rank', 'points_earned')
+
+    def __init__(self, contestant, awards):
+        self.contestant = contestant
+        self.awards = awards
+        self.round_count = 0
+        self.completed_event = False
+        self.scratch_score = 0
+        self.previous_handicap = None
+        self.handicap_score = None
+        self.handicap = None
+        self.rank = None
+        self.points_earned = None
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__[1:])
+
+
+class StandingRow(object):
+    """
+    A player's standing in a league.
+    """
+    __slots__ = ('player', 'initial_handicap', 'points', 'handicap', 'events_attended', 'rounds_played', 'valid_hc', 'rank')
+
+    def __init__(self, player):
+        self.player = player
+        self.initial_handicap = None
+        self.points = 0
+        self.handicap = None
+        self.events_attended = 0
+        self.rounds_played = 0
+        self.valid_hc = False
+        self.rank = None
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__[1:])
+
+
+def assign_ranks(rows, tied, dense=False):
+    """
+    Sets the rank of each of rows, which must already be in order, in a single pass.
+    tied(previous, row) says whether row shares the rank of the row before it. Ranks
+    are competition ranks ("1224"), or dense ranks ("1223") if dense is True.
+    """
+    rank = 0
+    previous = None
+    for index, row in enumerate(rows):
+        if previous is not None and not tied(previous, row):
+            rank = rank + 1 if dense else index
+        row.rank = rank + 1
+        previous = row
+    return rows
+
+
+def rank_event(rows, rounds, league_points):
+    """
+    Returns the EventRows of an event in rank order, with their rank and points earned set.
+
+    Contestants who completed all rounds come first, by handicap score, then those who
+    didn't, by rounds completed then handicap score, then those without a handicap, by
+    scratch score. league_points is the league's points for each rank, the last of
+    which is the minimum earned by anyone who finished.
+    """
+    # rows are grouped through dicts so that rows with equal scores stay in the
+    # order results have always had
+    complete, incomplete, no_hc = {}, {}, {}
+    for row in rows:
+        if row.handicap_score is None:
+            no_hc[row.contestant] = row
+        elif not row.completed_event:
+            incomplete[row.contestant] = row
+        else:
+            complete[row.contestant] = row
+    ranked = sorted(complete.values(), key=lambda row: row.handicap_score)
+    ranked += sorted(incomplete.values(), key=lambda row: (-row.round_count, row.handicap_score))
+    ranked += sorted(no_hc.values(), key=lambda row: row.scratch_score)
+
+    assign_ranks(ranked, lambda previous, row: previous.handicap_score == (row.handicap_score or 0))
+    for row in ranked:
+        if row.handicap_score is None:
+            row.points_earned = None
+        elif row.round_count < rounds:
+            # contestant completed less than the required rounds, assign minimum possible points.
+            row.points_earned = league_points[-1]
+        else:
+            row.points_earned = league_points[min(row.rank, len(league_points)) - 1]
+    return ranked
+
+
+def rank_standings(rows):
+    """
+    Returns the StandingRows of a league in rank order, by points, with their rank set.
+    """
+    ranked = sorted(rows, key=lambda row: row.points, reverse=True)
+    return assign_ranks(ranked, lambda previous, row: previous.points == row.points)
@@ -0,0 +1,205 @@
+"""
+Maintenance of the stored EventResultRow and LeagueStandingRow tables.
+
+When a Score, Card, Award, Event, Contestant, Layout, Hole or League changes, the
+affected league's results are recomputed from the earliest affected event onwards,
+since handicaps carry forward from one event to the next. League standings are then
+re-aggregated from the stored event rows. This is also when initial handicaps are
+seeded; computing results never writes anything.
+"""
+from dgs.cache import get_version, league_namespace
+from django.core.cache import cache, caches
+from django.db import transaction, connections
+from dgs import changes, invalidation, models
+import multiprocessing
+import json
+import time
+
+
+def get_affected_leagues(instance, affected=None, relations_only=False):
+    """
+    Returns a dict of League pk to the earliest Event affected by a change to instance,
+    or None if the whole league is affected. If given, affected is updated in place.
+    relations_only should be True if only instance's many-to-many relations changed.
+    """
+    if affected is None:
+        affected = {}
+
+    def add(league, event=None):
+        merge_affected(affected, {league.pk: event})
+
+    def add_events(events, whole_league=False):
+        for event in events:
+            if event.league_id is not None:
+                merge_affected(affected, {event.league_id: None if whole_league else event})
+
+    if isinstance(instance, models.League):
+        add(instance)
+    elif isinstance(instance, models.Event):
+        # unless only its cards or awards changed, the event may have moved relative to its
+        # siblings, so recompute the whole league
+        add_events(models.Event.objects.filter(pk=instance.pk), whole_league=not relations_only)
+    elif isinstance(instance, models.Contestant):
+        for league in instance.league_set.all():
+            add(league)
+    elif isinstance(instance, models.Card):
+        add_events(models.Event.objects.filter(pk__in=models.Card.objects.filter(pk=instance.pk).values('event')))
+    elif isinstance(instance, models.Award):
+        add_events(instance.event_set.all())
+    elif isinstance(instance, models.Score):
+        cards = models.Card.objects.filter(pk__in=models.Score.objects.filter(pk=instance.pk).values('card'))
+        add_events(models.Event.objects.filter(pk__in=cards.values('event')))
+    elif isinstance(instance, models.Layout):
+        add_events(models.Event.objects.filter(cards__layout=instance).distinct(), whole_league=True)
+    elif isinstance(instance, models.Hole):
+        add_events(models.Event.objects.filter(cards__layout__holes=instance).distinct(), whole_league=True)
+    elif isinstance(instance, models.Player):
+        for league in models.League.objects.filter(contestants__player=instance).distinct():
+            add(league)
+    elif isinstance(instance, models.Course):
+        add_events(models.Event.objects.filter(cards__course=instance).distinct(), whole_league=True)
+    return affected
+
+
+def merge_affected(affected, other):
+    """
+    Merges other into affected, both as returned by get_affected_leagues(), keeping the
+    earliest affected event of each league. Returns affected.
+    """
+    for league_pk, event in other.items():
+        if league_pk not in affected:
+            affected[league_pk] = event
+            continue
+        earliest = affected[league_pk]
+        if earliest is None or event is None:
+            affected[league_pk] = None
+        elif (event.date, event.pk) < (earliest.date, earliest.pk):
+            affected[league_pk] = event
+    return affected
+
+
+def seed_initial_handicaps(league):
+    """
+    Stores the initial handicap of each of league's contestants who has played
+    handicap_min_rounds rounds without having one, as used by the league's results.
+    Returns a dict of the pks of the contestants seeded to their initial handicaps.
+
+    A contestant's seed is also their handicap going into the events they played before
+    it, so each new seed changes the results of the whole league, not just of the events
+    since the change that produced it: see refresh_league(). Storing it stops their
+    initial handicap moving with later changes to their first rounds. Running it again
+    seeds nobody new.
+    """
+    seeded = {}
+    for pk, initial_handicap in league.get_initial_handicap_seeds().items():
+        # not save(), which would send this league's changes around again
+        if models.Contestant.objects.filter(pk=pk, initial_handicap=None).update(initial_handicap=initial_handicap):
+            seeded[pk] = initial_handicap
+    return seeded
+
+
+def refresh_league(league, since=None):
+    """
+    Seeds league's initial handicaps, then recomputes the stored results of its events from
+    the since Event's date onwards (or all events if since is None), followed by its
+    standings. Events at the same date as since are included whatever their order, since the
+    handicaps as at each of them count the cards of all of them.
+    If anyone was seeded, all of the league's events are recomputed and invalidated.
+    """
+    cache.delete('league_handicaps_%s' % league.pk, version=get_version(league_namespace(league.pk)))
+    seeded = seed_initial_handicaps(league)
+    if seeded:
+        since = None
+    events = league.get_snapshot().events_by_date
+    if since is not None:
+        events = [e for e in events if e.date >= since.date]
+    rows = []
+    for event in events:
+        rounds_played = event.get_rounds_played()
+        for position, (contestant, stats) in enumerate(event.result.items()):
+            rows.append(models.EventResultRow(
+                event=event,
+                contestant=contestant,
+                position=position,
+                rank=stats['rank'],
+                round_count=stats['round_count'],
+                rounds_played=rounds_played[contestant.pk],
+                completed_event=stats['completed_event'],
+                scratch_score=stats['scratch_score'],
+                previous_handicap=stats['previous_handicap'],
+                handicap=stats['handicap'],
+                handicap_score=stats['handicap_score'],
+                points_earned=stats['points_earned'],
+                awards=json.dumps(stats['awards']),
+                ))
+    with transaction.atomic():
+        models.EventResultRow.objects.filter(event__in=[e.pk for e in events]).delete()
+        models.EventResultRow.objects.bulk_create(rows)
+        refresh_standings(league)
+    if seeded:
+        invalidation.invalidate({league.pk: None}, set())
+
+
+def refresh_standings(league):
+    """
+    Re-aggregates league's stored standings from its stored event results.
+    """
+    event_rows = models.EventResultRow.objects.filter(event__league=league).select_related('contestant__player').order_by('event', 'position')
+    standings = league.get_standings([(row.contestant, row.stats, row.rounds_played) for row in event_rows])
+    models.LeagueStandingRow.objects.filter(league=league).delete()
+    models.LeagueStandingRow.objects.bulk_create([models.LeagueStandingRow(
+        league=league,
+        player=player,
+        position=position,
+        rank=stats['rank'],
+        points=stats['points'],
+        handicap=stats['handicap'],
+        initial_handicap=stats['initial_handicap'],
+        events_attended=stats['events_attended'],
+        rounds_played=stats['rounds_played'],
+        valid_hc=stats['valid_hc'],
+        ) for position, (player, stats) in enumerate(standings.items())])
+
+
+def refresh(affected):
+    """
+    Refreshes the stored results of every league in affected, as returned by get_affected_leagues().
+    """
+    for league in models.League.objects.filter(pk__in=affected.keys()):
+        refresh_league(league, since=affected[league.pk])
+
+
+def recompute_league(league_pk):
+    """
+    Rebuilds the stored results of the league with league_pk and invalidates what is
+    cached of it, returning (league_pk, seconds taken).
+    """
+    started = time.time()
+    changes.apply({league_pk: None}, set(), {league_pk: None})
+    return league_pk, time.time() - started
+
+
+def recompute(league_pks, processes=None):
+    """
+    Rebuilds the stored results of the leagues with league_pks, sharded across a pool of
+    processes (one per CPU if processes is None), yielding (league_pk, seconds taken) for
+    each league as it finishes. Leagues are handed out in the order given, so pass the
+    largest first. With processes=1, or on SQLite, which can't take writes from several
+    processes at once, they are rebuilt one after another in this process.
+    """
+    if processes == 1 or connections['default'].vendor == 'sqlite':
+        for league_pk in league_pks:
+            yield recompute_league(league_pk)
+        return
+    # the workers are forked from this process, so mustn't inherit its connections
+    connections.close_all()
+    for backend in caches.all():
+        backend.close()
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(recompute_league, league_pks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
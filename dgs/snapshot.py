@@ -0,0 +1,45 @@
+from dgs.cardindex import CompletedCardIndex
+from django.db.models import Prefetch
+
+
+class LeagueSnapshot(object):
+    """
+    An in-memory copy of a League's events, cards, scores, contestants, players,
+    layouts and awards, loaded in a fixed number of queries regardless of
+    how many events and cards the league has.
+
+    Events loaded by a snapshot remember it, so that Event.get_result(),
+    Event.get_latest_cards() and friends compute against the snapshot rather than
+    issuing their own queries.
+    """
+
+    def __init__(self, league):
+        from dgs import models
+        self.league = league
+        self.events = list(league.events.order_by('pk').prefetch_related(
+            Prefetch('cards', queryset=models.Card.objects.select_related('course', 'layout').order_by('pk')),
+            Prefetch('cards__scores', queryset=models.Score.objects.select_related('contestant__player').order_by('pk')),
+            Prefetch('awards', queryset=models.Award.objects.order_by('pk')),
+            ))
+        # share a single Contestant instance between all of its scores so that changes
+        # to it (eg. handicap seeding) are seen everywhere in the snapshot.
+        self.contestants = {}
+        for event in self.events:
+            event._snapshot = self
+            for card in event.cards.all():
+                for score in card.scores.all():
+                    score.contestant = self.contestants.setdefault(score.contestant_id, score.contestant)
+        self.event_map = dict((event.pk, event) for event in self.events)
+        # same ordering as Event.get_previous_by_date(): by date, then by pk
+        self.events_by_date = sorted(self.events, key=lambda e: (e.date, e.pk))
+
+    def get_event(self, pk):
+        return self.event_map[pk]
+
+    def get_card_index(self):
+        """
+        Returns a CompletedCardIndex of the league's cards, built once per snapshot.
+        """
+        if not hasattr(self, '_card_index'):
+            self._card_index = CompletedCardIndex(self.events)
+        return self._card_index
@@ -0,0 +1,43 @@
+from dgs.cache import get_version, instance_namespace
+from django.core.cache import cache
+from django import template
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, instance):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.instance = instance
+
+    def render(self, context):
+        instance = self.instance.resolve(context)
+        cache_key = 'fragment_%s_%s' % (self.fragment_name, instance.pk)
+        version = get_version(instance_namespace(instance))
+        value = cache.get(cache_key, version=version)
+        if value is None:
+            value = self.nodelist.render(context)
+            cache.set(cache_key, value, None, version=version)
+        return value
+
+
+@register.tag
+def cache_fragment(parser, token):
+    """
+    Caches the enclosed template fragment until the cache version of the given League,
+    Event or Card changes, see dgs.invalidation.
+
+    Usage::
+
+        {% load dgs_cache %}
+        {% cache_fragment event_result event %}
+            .. some expensive processing ..
+        {% endcache_fragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError("'%s' tag requires a fragment name and an instance." % bits[0])
+    nodelist = parser.parse(('endcache_fragment',))
+    parser.delete_first_token()
+    return FragmentCacheNode(nodelist, bits[1], parser.compile_filter(bits[2]))
@@ -5,7 +5,27 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.core.management import call_command
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache, caches
+from dgs.cache import get_version, bump_version, event_namespace, instance_namespace, league_namespace, GLOBAL_NAMESPACE
+from dgs.cache import get_stale_while_revalidate, TwoTierCache
 from django.test import TestCase
+from django.template.loader import render_to_string
+from django.apps import apps
+from unittest import skipIf
+from django.utils import timezone
+from django.db import connection, reset_queries, transaction
+import dgs
+from dgs import models, bench, changes, golden, handicap, instrumentation, names, ranking, results
+from logging.handlers import BufferingHandler
+import datetime
+import tempfile
+import json
+import csv
+import re
+import logging
 
 
 class SimpleTest(TestCase):
@@ -14,3 +34,832 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+def model_queries(context):
+    """
+    Returns the SQL of the queries captured by context that touch dgs's model tables,
+    leaving out those of the cache, which may be a database cache.
+    """
+    tables = set(model._meta.db_table for model in apps.get_app_config('dgs').get_models(include_auto_created=True))
+    return [query['sql'] for query in context.captured_queries if tables & set(re.findall(r'["`](\w+)["`]', query['sql']))]
+
+
+def capture_refreshes(function, *args, **kwargs):
+    """
+    Calls function, returning its result and a list of the leagues affected by each call
+    of dgs.results.refresh() it made.
+    """
+    refreshes = []
+    original_refresh = results.refresh
+    results.refresh = lambda affected: refreshes.append(affected) or original_refresh(affected)
+    try:
+        return function(*args, **kwargs), refreshes
+    finally:
+        results.refresh = original_refresh
+
+
+class LeagueTestCase(TestCase):
+    """
+    Base class for tests that need a league on an 18 hole, par 54 layout.
+    """
+    def setUp(self):
+        self.layout = models.Layout.objects.create(name="Blue tees")
+        self.layout.holes.add(*[models.Hole.objects.create(number=n, par=3) for n in range(1, 19)])
+        self.course = models.Course.objects.create(name="Test Course")
+        self.course.layouts.add(self.layout)
+        self.league = models.League.objects.create(name="Test League")
+        self.start = timezone.make_aware(datetime.datetime(2016, 1, 1, 9, 0), timezone.utc)
+
+    def add_contestant(self, first_name, last_name, initial_handicap=None):
+        player = models.Player.objects.create(first_name=first_name, last_name=last_name)
+        contestant = models.Contestant.objects.create(player=player, initial_handicap=initial_handicap)
+        self.league.contestants.add(contestant)
+        return contestant
+
+    def add_event(self, days, rounds=1):
+        event = models.Event.objects.create(name="Day %s" % days, date=self.start + datetime.timedelta(days=days), rounds=rounds)
+        self.league.events.add(event)
+        return event
+
+    def add_card(self, event, strokes, minutes=0):
+        """
+        strokes is a list of (contestant, strokes) tuples
+        """
+        date = event.date + datetime.timedelta(minutes=minutes)
+        card = models.Card.objects.create(course=self.course, layout=self.layout, date=date)
+        card.scores.add(*[models.Score.objects.create(contestant=c, strokes=s, date=date) for c, s in strokes])
+        event.cards.add(card)
+        return card
+
+
+class TwoEventLeagueTestCase(LeagueTestCase):
+    """
+    Base class for tests that need a league of two events: Alice, with an initial
+    handicap, plays both and Bob, without one, plays the second.
+    """
+    def setUp(self):
+        super(TwoEventLeagueTestCase, self).setUp()
+        self.alice = self.add_contestant("Alice", "Smith", initial_handicap=2.0)
+        self.bob = self.add_contestant("Bob", "Jones")
+        self.event1 = self.add_event(0)
+        self.event2 = self.add_event(7)
+        self.add_card(self.event1, [(self.alice, 58)])
+        self.add_card(self.event2, [(self.alice, 50), (self.bob, 60)])
+
+
+class HandicapEngineTest(TwoEventLeagueTestCase):
+
+    def test_handicap_carried_forward(self):
+        handicaps = self.league.get_handicaps()
+        self.assertEqual(handicaps.keys(), [self.event1.pk, self.event2.pk])
+        self.assertEqual(handicaps[self.event1.pk][self.alice.pk], {'previous_handicap': 2.0, 'handicap': 3.2})
+        self.assertEqual(handicaps[self.event2.pk][self.alice.pk], {'previous_handicap': 3.2, 'handicap': 0.0})
+        self.assertEqual(handicaps[self.event2.pk][self.bob.pk], {'previous_handicap': None, 'handicap': 4.8})
+        self.assertEqual(models.Event.get_previous_handicap(self.event2, self.alice), 3.2)
+
+    def test_event_result(self):
+        result = self.event2.result
+        self.assertEqual(result.keys(), [self.alice, self.bob])
+        self.assertEqual(result[self.alice]['handicap_score'], 47)
+        self.assertEqual(result[self.alice]['rank'], 1)
+        self.assertEqual(result[self.alice]['points_earned'], 10)
+        self.assertEqual(result[self.bob]['handicap_score'], None)
+        self.assertEqual(result[self.bob]['points_earned'], None)
+
+    def test_league_result(self):
+        standings = self.league.result
+        self.assertEqual(standings[self.alice.player]['points'], 20)
+        self.assertEqual(standings[self.alice.player]['handicap'], 0.0)
+        self.assertFalse(standings[self.bob.player]['valid_hc'])
+
+    @skipIf(handicap.numpy is None, "NumPy is not installed")
+    def test_numpy_averages_match_python(self):
+        self.add_card(self.event2, [(self.alice, 52), (self.bob, 56)], minutes=30)
+        events = self.league.get_snapshot().events_by_date
+        engine = handicap.HandicapEngine(self.league.get_snapshot())
+        self.assertEqual(engine.get_averages_numpy(events), engine.get_averages_python(events))
+        self.assertEqual(engine.get_averages_python(events)[self.event2.pk], {self.alice.pk: -2.0 / 3, self.bob.pk: 4.0})
+
+    def test_latest_cards(self):
+        late_card = self.add_card(self.event1, [(self.alice, 60), (self.bob, None)], minutes=30)
+        index = self.league.get_snapshot().get_card_index()
+        self.assertEqual([c.scratch_delta for c in index.latest(self.alice.pk, self.event1.date)], [6, 4])
+        self.assertEqual([c.scratch_delta for c in index.latest(self.alice.pk, n=2)], [-4, 6])
+        self.assertEqual(index.latest(self.bob.pk, self.event1.date), [])
+        self.assertEqual(self.event2.get_latest_cards(self.alice, 2), [-4, 6])
+        response = self.client.get('/api/contestant/%s/latest_cards/?event=%s' % (self.alice.pk, self.event1.pk))
+        self.assertEqual([card['scratch_delta'] for card in response.data], [6, 4])
+        self.assertEqual(response.data[0]['card'], 'http://testserver/api/card/%s/' % late_card.pk)
+
+    def test_initial_handicap_seeded(self):
+        self.add_card(self.event2, [(self.bob, 54)], minutes=30)
+        self.assertEqual(models.Contestant.objects.get(pk=self.bob.pk).initial_handicap, 2.4)
+
+    def test_results_are_read_only(self):
+        self.add_card(self.event2, [(self.bob, 54)], minutes=30)
+        models.Contestant.objects.filter(pk=self.bob.pk).update(initial_handicap=None)
+        cache.clear()
+        league = models.League.objects.get(pk=self.league.pk)
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            standings = league.result
+        self.assertEqual([sql for sql in model_queries(queries) if 'INSERT' in sql or 'UPDATE' in sql], [])
+        # computed as if seeded
+        self.assertEqual(standings[self.bob.player]['initial_handicap'], 2.4)
+        self.assertEqual(models.Contestant.objects.get(pk=self.bob.pk).initial_handicap, None)
+        self.assertEqual(results.seed_initial_handicaps(league), {self.bob.pk: 2.4})
+        self.assertEqual(models.Contestant.objects.get(pk=self.bob.pk).initial_handicap, 2.4)
+        league = models.League.objects.get(pk=self.league.pk)
+        self.assertEqual(results.seed_initial_handicaps(league), {})
+        self.assertEqual(league.result, standings)
+
+    def test_seed_command(self):
+        self.add_card(self.event2, [(self.bob, 54)], minutes=30)
+        models.Contestant.objects.filter(pk=self.bob.pk).update(initial_handicap=None)
+        version = models.DataVersion.get(GLOBAL_NAMESPACE).version
+        call_command('dgs_seed_handicaps', stdout=open('/dev/null', 'w'))
+        self.assertEqual(models.Contestant.objects.get(pk=self.bob.pk).initial_handicap, 2.4)
+        self.assertEqual(models.DataVersion.get(GLOBAL_NAMESPACE).version, version + 1)
+
+    def test_seed_refreshes_earlier_events(self):
+        carl = self.add_contestant("Carl", "Lee")
+        self.add_card(self.event1, [(carl, 57)], minutes=30)
+        version = get_version(event_namespace(self.event1.pk))
+        # Carl's second round seeds his initial handicap, which he also had going into event 1
+        self.add_card(self.event2, [(carl, 55)], minutes=30)
+        self.assertNotEqual(get_version(event_namespace(self.event1.pk)), version)
+        stats = self.event1.stored_result[carl]
+        self.assertEqual((stats['rank'], stats['handicap_score'], stats['points_earned']), (1, 55, 10))
+        self.assertEqual(stats, models.League.objects.get(pk=self.league.pk).get_snapshot().get_event(self.event1.pk).result[carl])
+        self.assertEqual(self.league.stored_result[carl.player]['points'], 19)
+
+
+class LeagueSnapshotTest(LeagueTestCase):
+    def populate(self, events, cards_per_event):
+        contestants = [self.add_contestant("Player", str(n), initial_handicap=n) for n in range(4)]
+        for days in range(events):
+            event = self.add_event(days, rounds=cards_per_event)
+            for minutes in range(cards_per_event):
+                self.add_card(event, [(c, 54 + minutes + c.initial_handicap) for c in contestants], minutes=minutes)
+
+    def count_queries(self):
+        cache.clear()
+        league = models.League.objects.get(pk=self.league.pk)
+        with CaptureQueriesContext(connection) as context:
+            league.result
+            for event in league.get_snapshot().events:
+                event.result
+                for card in event.cards.all():
+                    card.result
+        return len(model_queries(context))
+
+    def test_query_count_is_constant(self):
+        self.populate(events=2, cards_per_event=1)
+        small = self.count_queries()
+        self.populate(events=6, cards_per_event=3)
+        self.assertEqual(self.count_queries(), small)
+        self.assertLessEqual(small, 10)
+
+
+class InstrumentationMiddlewareTest(TwoEventLeagueTestCase):
+    def setUp(self):
+        super(InstrumentationMiddlewareTest, self).setUp()
+        # capture the request log lines rather than writing them to the console
+        logger = logging.getLogger('dgs.instrumentation')
+        self.addCleanup(setattr, logger, 'handlers', logger.handlers)
+        self.log = BufferingHandler(100)
+        logger.handlers = [self.log]
+
+    def login(self, is_staff):
+        user = User.objects.create_user("someone", password="secret")
+        user.is_staff = is_staff
+        user.save()
+        self.client.login(username="someone", password="secret")
+
+    @override_settings(DGS_INSTRUMENTATION=True)
+    def test_staff_get_instrumentation_headers(self):
+        self.login(is_staff=True)
+        response = self.client.get('/api/league/')
+        self.assertEqual(response['X-DGS-Queries'], str(len(connection.queries_log)))
+        self.assertIn('X-DGS-Time', response)
+        record = json.loads(self.log.buffer[-1].getMessage())
+        self.assertEqual((record['path'], record['status'], str(record['queries'])), ('/api/league/', 200, response['X-DGS-Queries']))
+
+    def test_off_by_default(self):
+        self.login(is_staff=True)
+        response = self.client.get('/api/league/')
+        self.assertNotIn('X-DGS-Time', response)
+        self.assertFalse(connection.force_debug_cursor)
+        self.assertEqual(self.log.buffer, [])
+
+    def test_timings_recorded(self):
+        stats = instrumentation.start()
+        try:
+            self.league.result
+        finally:
+            instrumentation.stop()
+        self.assertEqual(stats.timings['league_result'][0], 1)
+        self.assertEqual(stats.timings['event_result'][0], 2)
+
+    def test_profile_for_staff_only(self):
+        self.login(is_staff=False)
+        response = self.client.get('/api/league/?profile=1')
+        self.assertNotIn('X-DGS-Time', response)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        User.objects.filter(username="someone").update(is_staff=True)
+        response = self.client.get('/api/league/?profile=1')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertContains(response, "function calls")
+
+
+class ApiQueryTest(TwoEventLeagueTestCase):
+    def count_queries(self, path):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_constant_queries(self):
+        paths = ['/api/card/?page_size=1000', '/api/event/?page_size=1000', '/api/league/?page_size=1000', '/api/layout/']
+        before = [self.count_queries(path) for path in paths]
+        for days in range(14, 84, 7):
+            event = self.add_event(days)
+            for minutes in range(0, 100, 10):
+                self.add_card(event, [(self.alice, 54), (self.bob, 56)], minutes=minutes)
+        self.league.events.add(*models.Event.objects.all())
+        self.assertEqual([self.count_queries(path) for path in paths], before)
+        self.assertEqual(json.loads(self.client.get('/api/card/?page_size=1000').content)['count'], 102)
+
+    def test_compact_format(self):
+        card = self.event2.cards.get()
+        response = json.loads(self.client.get('/api/card/%s/?format=compact' % card.pk).content)
+        self.assertEqual(response['id'], card.pk)
+        self.assertEqual(response['layout'], self.layout.pk)
+        self.assertEqual(sorted(response['scores']), sorted(card.scores.values_list('pk', flat=True)))
+        response = json.loads(self.client.get('/api/card/%s/' % card.pk).content)
+        self.assertEqual(response['layout'], 'http://testserver/api/layout/%s/' % self.layout.pk)
+
+    def test_update_returns_current_relations(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        card = self.event2.cards.get()
+        score = card.scores.all()[0]
+        response = self.client.patch('/api/card/%s/?format=compact' % card.pk, json.dumps({'scores': [score.pk]}),
+                                     content_type='application/json')
+        self.assertEqual(json.loads(response.content)['scores'], [score.pk])
+
+
+class ResultApiTest(TwoEventLeagueTestCase):
+    def test_standings(self):
+        response = self.client.get('/api/league/%s/standings/' % self.league.pk)
+        self.assertEqual([(row['name'], row['rank'], row['points']) for row in response.data],
+                         [("Alice Smith", 1, 20), ("Bob Jones", 2, 0)])
+        self.assertEqual(response.data[0]['player'], 'http://testserver/api/player/%s/' % self.alice.player.pk)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/league/%s/standings/' % self.league.pk, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.add_card(self.event2, [(self.bob, 50)], minutes=30)
+        response = self.client.get('/api/league/%s/standings/' % self.league.pk, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[1]['points'], 9)
+
+    def test_event_results(self):
+        response = self.client.get('/api/event/%s/results/' % self.event2.pk)
+        self.assertEqual([(row['name'], row['rank'], row['handicap_score']) for row in response.data],
+                         [("Alice Smith", 1, 47), ("Bob Jones", 2, None)])
+        self.assertEqual(response.data[0]['contestant'], 'http://testserver/api/contestant/%s/' % self.alice.pk)
+        reset_queries()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/event/%s/results/' % self.event2.pk, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        event = models.Event.objects.create(name="Unplayed", date=self.start, rounds=1)
+        self.assertEqual(self.client.get('/api/event/%s/results/' % event.pk).status_code, 404)
+
+
+    def test_latest_cards(self):
+        path = '/api/contestant/%s/latest_cards/' % self.alice.pk
+        etag = self.client.get(path)['ETag']
+        reset_queries()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.add_card(self.event2, [(self.alice, 52)], minutes=30)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+
+
+class ExportTest(TwoEventLeagueTestCase):
+    def test_ndjson(self):
+        response = self.client.get('/api/league/%s/export/' % self.league.pk)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([record['record'] for record in records], ['event'] * 2 + ['card'] * 2 + ['score'] * 3 + ['result'] * 3)
+        self.assertEqual(records[0]['id'], self.event1.pk)
+        self.assertEqual([(record['player'], record['strokes']) for record in records[4:7]],
+                         [("Alice Smith", 58), ("Alice Smith", 50), ("Bob Jones", 60)])
+        self.assertEqual([(record['event'], record['player'], record['rank'], record['handicap_score']) for record in records[8:]],
+                         [(self.event2.pk, "Alice Smith", 1, 47), (self.event2.pk, "Bob Jones", 2, None)])
+        self.assertEqual(self.client.get('/api/league/%s/export/' % self.league.pk, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_csv(self):
+        response = self.client.get('/api/league/%s/export/?format=csv' % self.league.pk)
+        rows = list(csv.DictReader(b"".join(response.streaming_content).splitlines()))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual((rows[2]['record'], rows[2]['par'], rows[2]['strokes']), ('card', '54', ''))
+        self.assertEqual((rows[9]['record'], rows[9]['points_earned'], rows[9]['handicap']), ('result', '', '4.8'))
+
+    def test_unnamed_award(self):
+        self.event2.awards.add(models.Award.objects.create(name="CTP", contestant=self.alice),
+                               models.Award.objects.create(name=None, contestant=self.alice))
+        response = self.client.get('/api/league/%s/export/?format=csv' % self.league.pk)
+        rows = list(csv.DictReader(b"".join(response.streaming_content).splitlines()))
+        self.assertEqual([(row['player'], row['awards']) for row in rows if row['record'] == 'result'],
+                         [("Alice Smith", ""), ("Alice Smith", "CTP"), ("Bob Jones", "")])
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile() as output:
+            call_command('dgs_export', str(self.league.pk), format='csv', output=output.name)
+            self.assertEqual(output.read(), b"".join(self.client.get('/api/league/%s/export/?format=csv' % self.league.pk).streaming_content))
+
+
+class ConditionalGetTest(TwoEventLeagueTestCase):
+    def setUp(self):
+        # the data versions, unlike the cache, are rolled back after each test
+        cache.clear()
+        super(ConditionalGetTest, self).setUp()
+
+    def test_home_page(self):
+        response = self.client.get('/')
+        etag = response['ETag']
+        reset_queries()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.event1.name = "Renamed"
+        self.event1.save()
+        # the stale page still carries the ETag of the version it was rendered from
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_api(self):
+        response = self.client.get('/api/card/')
+        etag = response['ETag']
+        reset_queries()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/card/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get('/api/card/?format=compact')['ETag'], etag)
+        models.Hole.objects.create(number=19, par=3)
+        self.assertEqual(self.client.get('/api/card/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CardEntryTest(TwoEventLeagueTestCase):
+    def setUp(self):
+        super(CardEntryTest, self).setUp()
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+
+    def post(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def test_enter_event_cards(self):
+        date = self.event2.date + datetime.timedelta(hours=1)
+        cards = [{'course': self.course.pk, 'layout': self.layout.pk, 'date': date.isoformat(),
+                  'scores': [{'contestant': self.alice.pk, 'strokes': 52}, {'contestant': self.bob.pk, 'strokes': None}]},
+                 {'course': self.course.pk, 'layout': self.layout.pk, 'date': date.isoformat(),
+                  'scores': [{'contestant': self.bob.pk, 'strokes': 56}]}]
+        response, refreshes = capture_refreshes(self.post, '/api/event/%s/enter/?format=compact' % self.event2.pk, cards)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(refreshes), 1)
+        self.assertEqual([len(card['scores']) for card in response.data], [2, 1])
+        card = models.Card.objects.get(pk=response.data[0]['id'])
+        self.assertEqual(card.event_set.get(), self.event2)
+        self.assertEqual(set(card.scores.values_list('date', flat=True)), set([date]))
+        self.assertEqual(self.event2.stored_result[self.bob]['round_count'], 2)
+
+    def test_enter_card(self):
+        card = {'course': 'http://testserver/api/course/%s/' % self.course.pk, 'layout': 'http://testserver/api/layout/%s/' % self.layout.pk,
+                'date': self.event2.date.isoformat(), 'scores': [{'contestant': 'http://testserver/api/contestant/%s/' % self.alice.pk, 'strokes': 50}]}
+        response = self.post('/api/card/enter/', card)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['scores']), 1)
+
+    def test_card_and_score_permissions_needed(self):
+        card = {'course': self.course.pk, 'layout': self.layout.pk, 'date': self.event2.date.isoformat(),
+                'scores': [{'contestant': self.alice.pk, 'strokes': 50}]}
+        user = User.objects.create_user('scorer', password='password')
+        self.client.login(username='scorer', password='password')
+        counts = models.Card.objects.count(), models.Score.objects.count()
+        for path, permissions in (('/api/event/%s/enter/' % self.event2.pk, ['add_event']), ('/api/card/enter/', ['add_card'])):
+            user.user_permissions = Permission.objects.filter(content_type__app_label='dgs', codename__in=permissions)
+            self.assertEqual(self.post(path + '?format=compact', card).status_code, 403)
+        self.assertEqual((models.Card.objects.count(), models.Score.objects.count()), counts)
+
+    def test_invalid_cards_not_entered(self):
+        cards = [{'course': self.course.pk, 'layout': self.layout.pk, 'date': self.event2.date.isoformat(),
+                  'scores': [{'contestant': self.alice.pk, 'strokes': 52}]},
+                 {'course': self.course.pk, 'layout': self.layout.pk, 'date': self.event2.date.isoformat(),
+                  'scores': [{'contestant': self.bob.pk, 'strokes': 52}, {'contestant': self.bob.pk, 'strokes': 53}]}]
+        counts = models.Card.objects.count(), models.Score.objects.count()
+        self.assertEqual(self.post('/api/event/%s/enter/?format=compact' % self.event2.pk, cards).status_code, 400)
+        self.assertEqual((models.Card.objects.count(), models.Score.objects.count()), counts)
+
+
+class BatchChangesTest(TwoEventLeagueTestCase):
+    def test_batch_changes(self):
+        @dgs.batch_changes()
+        def change():
+            for score in models.Score.objects.filter(contestant=self.alice):
+                score.strokes += 1
+                score.save()
+            with dgs.batch_changes():
+                self.event2.rounds = 2
+                self.event2.save()
+            # nothing is applied until the outermost batch exits
+            self.assertEqual(self.event1.stored_result[self.alice]['scratch_score'], 58)
+        version = models.DataVersion.get(league_namespace(self.league.pk)).version
+        self.assertEqual(len(capture_refreshes(change)[1]), 1)
+        self.assertEqual(models.DataVersion.get(league_namespace(self.league.pk)).version, version + 1)
+        self.assertEqual(self.event1.stored_result[self.alice]['scratch_score'], 59)
+        self.assertFalse(self.event2.stored_result[self.alice]['completed_event'])
+
+    def test_failed_batch_discarded(self):
+        @dgs.batch_changes()
+        def change():
+            with transaction.atomic():
+                self.event2.rounds = 2
+                self.event2.save()
+                raise ValueError
+        self.assertEqual(len(capture_refreshes(self.assertRaises, ValueError, change)[1]), 0)
+        self.assertIsNone(changes.current())
+        # changes outside a batch are applied right away again
+        self.assertEqual(len(capture_refreshes(self.event2.save)[1]), 1)
+
+    def test_loaddata(self):
+        fixture = tempfile.NamedTemporaryFile(suffix='.json')
+        fixture.write(json.dumps([obj for obj in json.load(open(golden.TESTDATA)) if obj['model'].startswith('dgs.')]))
+        fixture.flush()
+        self.assertEqual(len(capture_refreshes(call_command, 'loaddata', fixture.name, verbosity=0)[1]), 1)
+        for league in models.League.objects.all():
+            self.assertEqual(league.stored_result, league.result)
+
+    def test_admin_save(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        data = {'name': "Renamed", 'date_0': '2016-01-08', 'date_1': '09:00:00', 'rounds': 1,
+                'cards': [card.pk for card in self.event2.cards.all()]}
+        self.assertEqual(len(capture_refreshes(self.client.post, '/admin/dgs/event/%s/' % self.event2.pk, data)[1]), 1)
+        self.assertEqual(models.Event.objects.get(pk=self.event2.pk).name, "Renamed")
+
+
+class RankingTest(TestCase):
+    def event_row(self, name, handicap_score, round_count=2, scratch_score=0):
+        row = ranking.EventRow(name, [])
+        row.handicap_score, row.round_count, row.scratch_score = handicap_score, round_count, scratch_score
+        row.completed_event = round_count >= 2
+        return row
+
+    def test_assign_ranks(self):
+        rows = [ranking.StandingRow(points) for points in (30, 20, 20, 10)]
+        tied = lambda previous, row: previous.player == row.player
+        self.assertEqual([row.rank for row in ranking.assign_ranks(rows, tied)], [1, 2, 2, 4])
+        self.assertEqual([row.rank for row in ranking.assign_ranks(rows, tied, dense=True)], [1, 2, 2, 3])
+
+    def test_rank_event(self):
+        rows = [self.event_row("no hc", None, scratch_score=60), self.event_row("incomplete", 40, round_count=1),
+                self.event_row("second", 110), self.event_row("first", 100), self.event_row("tied second", 110)]
+        ranked = ranking.rank_event(rows, 2, [10, 9, 5])
+        contestants = [row.contestant for row in ranked]
+        self.assertEqual(contestants[:1] + sorted(contestants[1:3]) + contestants[3:], ["first", "second", "tied second", "incomplete", "no hc"])
+        self.assertEqual([row.rank for row in ranked], [1, 2, 2, 4, 5])
+        self.assertEqual([row.points_earned for row in ranked], [10, 9, 9, 5, None])
+
+
+class SyntheticLeagueTest(TestCase):
+    def test_generate_league(self):
+        league = bench.generate_league("Bench", players=6, events=3, cards_per_event=2, rounds=2)
+        self.assertEqual(league.events.count(), 3)
+        self.assertEqual(models.Card.objects.filter(event__league=league).count(), 12)
+        self.assertEqual(models.Score.objects.filter(card__event__league=league).count(), sum(
+            card.scores.count() for card in models.Card.objects.all()))
+        self.assertEqual(league.stored_result, league.result)
+
+
+class GoldenResultTest(TestCase):
+    def test_testdata_results_unchanged(self):
+        golden.load_testdata()
+        actual = json.loads(golden.dumps(golden.snapshot()))
+        self.assertEqual(golden.diff(golden.load(), actual), [])
+
+    def test_diff(self):
+        expected = {'event 1': [{'rank': 1, 'handicap': 2.0}], 'league 1': []}
+        actual = {'event 1': [{'rank': 2, 'handicap': 2}]}
+        self.assertEqual(golden.diff(expected, actual), [
+            "event 1[0].handicap: 2.0 != 2", "event 1[0].rank: 1 != 2", "league 1: missing"])
+
+
+class StoredResultTest(TwoEventLeagueTestCase):
+    def assertStoredResultsCurrent(self):
+        league = models.League.objects.get(pk=self.league.pk)
+        self.assertEqual(league.stored_result, league.result)
+        for event in league.get_snapshot().events:
+            self.assertEqual(event.stored_result, event.result)
+
+    def test_rows_maintained(self):
+        self.assertStoredResultsCurrent()
+        score = self.event2.cards.get().scores.get(contestant=self.alice)
+        score.strokes = 70
+        score.save()
+        self.assertStoredResultsCurrent()
+        self.event1.cards.get().delete()
+        self.assertStoredResultsCurrent()
+
+    def test_only_later_events_recomputed(self):
+        event1_rows = list(models.EventResultRow.objects.filter(event=self.event1).values_list('pk', flat=True))
+        event2_rows = list(models.EventResultRow.objects.filter(event=self.event2).values_list('pk', flat=True))
+        self.add_card(self.event2, [(self.alice, 55)], minutes=30)
+        self.assertEqual(list(models.EventResultRow.objects.filter(event=self.event1).values_list('pk', flat=True)), event1_rows)
+        self.assertNotEqual(list(models.EventResultRow.objects.filter(event=self.event2).values_list('pk', flat=True)), event2_rows)
+        self.assertStoredResultsCurrent()
+
+    def assertInvalidated(self, function):
+        event_version = get_version(event_namespace(self.event1.pk))
+        data_version = models.DataVersion.get(league_namespace(self.league.pk)).version
+        function()
+        self.assertNotEqual(get_version(event_namespace(self.event1.pk)), event_version)
+        self.assertEqual(models.DataVersion.get(league_namespace(self.league.pk)).version, data_version + 1)
+
+    def test_events_at_the_same_time(self):
+        event3 = self.add_event(14)
+        event4 = self.add_event(14)
+        self.add_card(event3, [(self.bob, 58)])
+        version = get_version(event_namespace(event3.pk))
+        # event4's cards count towards handicaps as at event3 too, since they are at the same time
+        self.add_card(event4, [(self.bob, 54)])
+        self.assertStoredResultsCurrent()
+        self.assertNotEqual(get_version(event_namespace(event3.pk)), version)
+
+    def test_rebuild_command(self):
+        models.EventResultRow.objects.all().delete()
+        models.LeagueStandingRow.objects.all().delete()
+        self.assertInvalidated(lambda: call_command('dgs_rebuild_results', stdout=open('/dev/null', 'w')))
+        self.assertStoredResultsCurrent()
+
+    def test_recompute_command(self):
+        models.EventResultRow.objects.all().delete()
+        models.LeagueStandingRow.objects.all().delete()
+        # the test database isn't shared with forked workers
+        self.assertInvalidated(lambda: call_command('dgs_recompute', processes=1, stdout=open('/dev/null', 'w')))
+        self.assertStoredResultsCurrent()
+
+
+class CacheInvalidationTest(TwoEventLeagueTestCase):
+    def setUp(self):
+        super(CacheInvalidationTest, self).setUp()
+        self.other_league = models.League.objects.create(name="Other League")
+
+    def versions(self):
+        return [get_version(league_namespace(self.league.pk)), get_version(league_namespace(self.other_league.pk)), get_version(GLOBAL_NAMESPACE)]
+
+    def test_score_change_invalidates_its_league_only(self):
+        league_version, other_version, global_version = self.versions()
+        score = self.event2.cards.get().scores.get(contestant=self.alice)
+        score.strokes = 51
+        score.save()
+        new_league_version, new_other_version, new_global_version = self.versions()
+        self.assertNotEqual(new_league_version, league_version)
+        self.assertEqual(new_other_version, other_version)
+        self.assertNotEqual(new_global_version, global_version)
+
+    def test_unrelated_model_changes_ignored(self):
+        versions = self.versions()
+        User.objects.create_user("someone")
+        self.assertEqual(self.versions(), versions)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            DGS_BACKGROUND_REVALIDATION=False)
+    def test_home_page_cached(self):
+        # other tests share the LocMemCache, and fill it to the point of culling version keys
+        cache.clear()
+        self.client.get('/')
+        # only the DataVersion behind the page's ETag
+        with self.assertNumQueries(1):
+            self.client.get('/')
+        self.event1.name = "Renamed"
+        self.event1.save()
+        # the stale page is served while it is recomputed
+        self.assertNotContains(self.client.get('/'), "Renamed")
+        self.assertContains(self.client.get('/'), "Renamed")
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        DGS_BACKGROUND_REVALIDATION=False)
+class FragmentCacheTest(TwoEventLeagueTestCase):
+    def setUp(self):
+        # other tests share the LocMemCache, and fill it to the point of culling version keys
+        cache.clear()
+        super(FragmentCacheTest, self).setUp()
+
+    def cached_fragments(self):
+        fragments = [('league_standings', self.league), ('event_result', self.event1), ('event_result', self.event2)]
+        fragments += [('card_result', card) for card in models.Card.objects.order_by('pk')]
+        return [cache.get('fragment_%s_%s' % (name, instance.pk), version=get_version(instance_namespace(instance))) is not None
+                for name, instance in fragments]
+
+    def test_only_changed_fragments_invalidated(self):
+        self.client.get('/')
+        self.assertEqual(self.cached_fragments(), [True, True, True, True, True])
+        score = self.event2.cards.get().scores.get(contestant=self.alice)
+        score.strokes = 51
+        score.save()
+        self.assertEqual(self.cached_fragments(), [False, True, False, True, False])
+        self.client.get('/')
+        self.assertEqual(self.cached_fragments(), [True, True, True, True, True])
+        self.assertContains(self.client.get('/'), "<td>51</td>")
+
+    def test_player_change_invalidates_their_cards(self):
+        self.client.get('/')
+        self.bob.player.first_name = "Robert"
+        self.bob.player.save()
+        self.assertEqual(self.cached_fragments(), [False, False, False, True, False])
+
+    def test_new_namesake_invalidates_cards(self):
+        self.client.get('/')
+        models.Player.objects.create(first_name="bob", last_name="Brown")
+        self.assertEqual(self.cached_fragments(), [False, False, False, True, False])
+        self.client.get('/')
+        self.assertContains(self.client.get('/'), "(Alice, Bob J)")
+
+    def test_cached_fragments_need_no_scores(self):
+        html = render_to_string('index.html', {'leagues': models.League.objects.all()})
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(render_to_string('index.html', {'leagues': models.League.objects.all()}), html)
+        self.assertNotIn('"%s"' % models.Score._meta.db_table, " ".join(model_queries(context)))
+
+
+class LayoutTotalsTest(LeagueTestCase):
+    def stored_totals(self):
+        return models.Layout.objects.filter(pk=self.layout.pk).values_list('par', 'hole_count').get()
+
+    def test_totals_maintained(self):
+        self.assertEqual((self.layout.par, self.layout.hole_count), (54, 18))
+        hole = models.Hole.objects.create(number=19, par=4)
+        self.layout.holes.add(hole)
+        self.assertEqual((self.layout.par, self.layout.hole_count), (58, 19))
+        self.assertEqual(self.stored_totals(), (58, 19))
+        hole.par = 5
+        hole.save()
+        self.assertEqual(self.stored_totals(), (59, 19))
+        hole.layout_set.clear()
+        self.assertEqual(self.stored_totals(), (54, 18))
+        hole.layout_set.add(self.layout)
+        self.layout.holes.get(number=1).delete()
+        self.assertEqual(self.stored_totals(), (56, 18))
+
+    def test_stale_instance_save_keeps_totals(self):
+        models.Hole.objects.get(number=1).delete()
+        self.layout.save()
+        self.assertEqual((self.layout.par, self.layout.hole_count), (51, 17))
+        self.assertEqual(self.stored_totals(), (51, 17))
+
+    def test_card_rendering_needs_no_hole_queries(self):
+        card = self.add_card(self.add_event(0), [(self.add_contestant("Alice", "Smith"), 50)])
+        card = models.Card.objects.select_related('layout').prefetch_related('scores__contestant').get(pk=card.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(card.result.values()[0]['scratch_delta'], "-4")
+            self.assertEqual(card.layout.par, 54)
+
+
+class OwnerForeignKeyTest(LeagueTestCase):
+    def setUp(self):
+        super(OwnerForeignKeyTest, self).setUp()
+        self.alice = self.add_contestant("Alice", "Smith", initial_handicap=2.0)
+        self.event = self.add_event(0)
+        self.card = self.add_card(self.event, [(self.alice, 58)])
+        self.score = self.card.scores.get()
+
+    def owners(self):
+        return (models.Score.objects.get(pk=self.score.pk).card_id, models.Card.objects.get(pk=self.card.pk).event_id,
+                models.Event.objects.get(pk=self.event.pk).league_id)
+
+    def test_owners_maintained(self):
+        self.assertEqual(self.owners(), (self.card.pk, self.event.pk, self.league.pk))
+        self.event.cards.remove(self.card)
+        self.assertEqual(self.owners(), (self.card.pk, None, self.league.pk))
+        self.card.event_set.add(self.event)
+        self.assertEqual(self.card.event_id, self.event.pk)
+        self.card.scores.clear()
+        self.league.events.clear()
+        self.assertEqual(self.owners(), (None, self.event.pk, None))
+        self.card.scores.add(self.score)
+        self.assertEqual(models.Score.objects.get(pk=self.score.pk).card_id, self.card.pk)
+        self.card.delete()
+        self.assertEqual(models.Score.objects.get(pk=self.score.pk).card_id, None)
+
+    def test_stale_instance_save_keeps_owner(self):
+        # added to the league by League.events.add(), so its league is only set in the database
+        self.assertEqual(self.event.league_id, None)
+        self.event.save()
+        self.assertEqual(self.event.league_id, self.league.pk)
+        self.assertEqual(self.owners(), (self.card.pk, self.event.pk, self.league.pk))
+
+
+class ShortestNameTest(LeagueTestCase):
+    def test_compute_shortest_names(self):
+        shortest_names = names.compute_shortest_names([
+            (1, "Alice", "Smith"), (2, "Bob", "Jones"), (3, "bob", "Brown"), (4, "Carl", "Lee"), (5, "Carl", "Long")])
+        self.assertEqual(shortest_names, {1: "Alice", 2: "Bob J", 3: "bob B", 4: "Carl Lee", 5: "Carl Long"})
+
+    def test_empty_last_name(self):
+        shortest_names = names.compute_shortest_names([(1, "Bob", ""), (2, "Bob", "Jones"), (3, "Carl", "")])
+        self.assertEqual(shortest_names, {1: "Bob", 2: "Bob J", 3: "Carl"})
+
+    def test_card_players_uses_cached_names(self):
+        contestants = [self.add_contestant("Bob", last_name) for last_name in ("Jones", "Brown")]
+        self.assertEqual([c.player.shortest_name for c in contestants], ["Bob J", "Bob B"])
+        card = self.add_card(self.add_event(0), [(c, 54) for c in contestants])
+        card = models.Card.objects.prefetch_related('scores__contestant__player').get(pk=card.pk)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(card.players, "Bob J, Bob B")
+        self.assertEqual(model_queries(context), [])
+
+
+@override_settings(DGS_BACKGROUND_REVALIDATION=False)
+class StaleWhileRevalidateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_stale_value_served_while_revalidating(self):
+        self.assertEqual(get_stale_while_revalidate('swr_test', self.compute, 'swr'), 1)
+        self.assertEqual(get_stale_while_revalidate('swr_test', self.compute, 'swr'), 1)
+        bump_version('swr')
+        self.assertEqual(get_stale_while_revalidate('swr_test', self.compute, 'swr'), 1)
+        self.assertEqual(get_stale_while_revalidate('swr_test', self.compute, 'swr'), 2)
+        self.assertEqual(self.calls, 2)
+
+    def test_one_revalidation_per_key(self):
+        get_stale_while_revalidate('swr_test', self.compute, 'swr')
+        bump_version('swr')
+        cache.add('revalidate_lock_swr_test', True)
+        self.assertEqual(get_stale_while_revalidate('swr_test', self.compute, 'swr'), 1)
+        self.assertEqual(self.calls, 1)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'dgs.cache.TwoTierCache', 'LOCATION': 'two-tier-test',
+                'OPTIONS': {'SHARED': 'shared', 'MAX_ENTRIES': 2, 'GENERATION_CHECK_INTERVAL': 0}},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'two-tier-test-shared'},
+    })
+class TwoTierCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache.reset_stats()
+
+    def test_reads_served_from_local_tier(self):
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('a'), 1)
+        stats = cache.stats()
+        self.assertEqual((stats['local']['hits'], stats['shared']['hits'] + stats['shared']['misses']), (2, 0))
+
+    def test_local_tier_is_bounded(self):
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key, version=1)
+        self.assertEqual(cache.stats()['local']['entries'], 2)
+        self.assertEqual(cache.get('a', version=1), 'a')
+        self.assertEqual(cache.stats()['shared']['hits'], 1)
+
+    def test_writes_by_other_processes_invalidate_local_tier(self):
+        cache.set('a', 1)
+        cache.get('a')
+        caches['shared'].set('a', 2)
+        caches['shared'].set(TwoTierCache.GENERATION_KEY, 'other')
+        self.assertEqual(cache.get('a'), 2)
+
+    def test_only_version_changes_change_generation(self):
+        cache.get('a')
+        generation = caches['shared'].get(TwoTierCache.GENERATION_KEY)
+        cache.set('a', 1, version=get_version('ns'))
+        # eg. a revalidated stale-while-revalidate entry, and the lock taken to revalidate it
+        cache.add('revalidate_lock_b', True)
+        cache.set('b', 2)
+        cache.delete('revalidate_lock_b')
+        self.assertEqual(caches['shared'].get(TwoTierCache.GENERATION_KEY), generation)
+        self.assertEqual(cache.stats()['local']['entries'], 2)
+        bump_version('ns')
+        self.assertNotEqual(caches['shared'].get(TwoTierCache.GENERATION_KEY), generation)
+
+    def test_versioned_namespaces(self):
+        version = get_version('ns')
+        cache.set('a', 1, version=version)
+        bump_version('ns')
+        self.assertIsNone(cache.get('a', version=get_version('ns')))
@@ -1,28 +1,195 @@
 from django.views.decorators.cache import cache_page
-from rest_framework.decorators import api_view
+from django.views.decorators.http import condition
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from calendar import timegm
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.decorators import api_view, detail_route, list_route
+from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
+from django.db.models import Prefetch
+from django.db import transaction
+from dgs.changes import batch_changes
 from rest_framework import viewsets
-from dgs.cache import cache_per
+from dgs.cache import cache_per, get_version, league_namespace, GLOBAL_NAMESPACE
+from django.core.cache import cache
+from dgs import export
 import dgs.api.serializers
+import dgs.api.renderers
 import models
 
 
+##### Conditional GET ####
+
+
+def get_data_version(request, namespace):
+    """
+    Returns the DataVersion of namespace, looked up once per request.
+    """
+    if not hasattr(request, 'data_version'):
+        request.data_version = namespace and models.DataVersion.get(namespace)
+    return request.data_version
+
+
+def data_version_condition(get_namespace=None, get_version=None):
+    """
+    Decorates a view to answer conditional GETs (If-None-Match and If-Modified-Since) with
+    304 Not Modified, based on the DataVersion of the namespace returned by
+    get_namespace(*args, **kwargs), or the DataVersion returned by get_version(*args, **kwargs).
+    API responses get a separate ETag for each format.
+    """
+    def get(request, *args, **kwargs):
+        if not hasattr(request, 'data_version'):
+            if get_version is not None:
+                request.data_version = get_version(*args, **kwargs)
+            else:
+                get_data_version(request, get_namespace(*args, **kwargs))
+        return request.data_version
+
+    def etag(request, *args, **kwargs):
+        data_version = get(request, *args, **kwargs)
+        renderer = getattr(request, 'accepted_renderer', None)
+        if data_version and renderer is not None:
+            return '%s-%s' % (data_version.etag, renderer.format)
+        return data_version and data_version.etag
+
+    def last_modified(request, *args, **kwargs):
+        data_version = get(request, *args, **kwargs)
+        return data_version and data_version.modified
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def get_global_namespace(*args, **kwargs):
+    return GLOBAL_NAMESPACE
+
+
 ##### App Views ####
 
 
-@cache_per(None, username="all")
+@data_version_condition(get_global_namespace)
+@cache_per(None, username="all", namespace=GLOBAL_NAMESPACE, stale_while_revalidate=True)
 def home(request):
+    data_version = get_data_version(request, GLOBAL_NAMESPACE)
     context = {
             'leagues': models.League.objects.all()
             }
-    return render(request, 'index.html', context)
+    response = render(request, 'index.html', context)
+    # tag the page with the version it was rendered from, so that a stale copy of it
+    # served while it is recomputed doesn't get the current version's ETag
+    response['ETag'] = quote_etag(data_version.etag)
+    if data_version.modified:
+        response['Last-Modified'] = http_date(timegm(data_version.modified.utctimetuple()))
+    return response
 
 
 ##### API Views ####
 
-class PlayerViewSet(viewsets.ModelViewSet):
+def get_league_namespace(pk):
+    return league_namespace(pk)
+
+
+def get_event_league_version(pk):
+    return models.DataVersion.get_for_event_league(pk)
+
+
+def get_contestant_league_version(pk):
+    return models.DataVersion.get_for_contestant_league(pk)
+
+
+def enter_cards(viewset, request, event=None):
+    """
+    Creates the cards in request.data, each with all of its scores, and adds them to event
+    if given. Either all of the cards are created or, if any is invalid, none are. The
+    changes to the league are applied once all the cards are in.
+
+    The viewset's permissions only cover its own model, so the user must also be allowed
+    to add cards and scores.
+    """
+    if not request.user.has_perms(['dgs.add_card', 'dgs.add_score']):
+        raise PermissionDenied("You do not have permission to add cards and scores.")
+    many = isinstance(request.data, list)
+    entry = dgs.api.serializers.CardEntrySerializer(data=request.data, many=many, context=viewset.get_serializer_context())
+    entry.is_valid(raise_exception=True)
+    cards = []
+    with batch_changes():
+        with transaction.atomic():
+            for card_data in entry.validated_data if many else [entry.validated_data]:
+                card = models.Card.objects.create(course=card_data['course'], layout=card_data['layout'], date=card_data['date'])
+                card.scores.add(*[models.Score.objects.create(contestant=score_data['contestant'], strokes=score_data['strokes'], date=card.date)
+                                  for score_data in card_data['scores']])
+                cards.append(card)
+            if event is not None:
+                event.cards.add(*cards)
+    card_serializer = dgs.api.serializers.CardSerializer
+    if viewset.is_compact():
+        card_serializer = dgs.api.serializers.compact(card_serializer)
+    cards = models.Card.objects.filter(pk__in=[card.pk for card in cards]).order_by('pk').prefetch_related('scores')
+    data = card_serializer(cards, many=True, context=viewset.get_serializer_context()).data
+    return Response(data if many else data[0], status=status.HTTP_201_CREATED)
+
+
+def get_cached_result(key, league_pk, compute):
+    """
+    Returns the value cached under key for the current version of league, computing it
+    with compute() if need be.
+    """
+    version = get_version(league_namespace(league_pk))
+    value = cache.get(key, version=version)
+    if value is None:
+        value = compute()
+        cache.set(key, value, None, version=version)
+    return value
+
+
+class ModelViewSet(viewsets.ModelViewSet):
+    """
+    A ModelViewSet whose queryset prefetches the related objects its serializer lists, and
+    that serializes them as primary keys instead of hyperlinks when ?format=compact is used.
+    Lists and objects are answered with 304 Not Modified until any data changes.
+    """
+    def is_compact(self):
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return renderer is not None and renderer.format == 'compact'
+
+    def get_serializer_class(self):
+        serializer_class = super(ModelViewSet, self).get_serializer_class()
+        if self.is_compact():
+            return dgs.api.serializers.compact(serializer_class)
+        return serializer_class
+
+    def get_serializer_context(self):
+        context = super(ModelViewSet, self).get_serializer_context()
+        context['compact'] = self.is_compact()
+        return context
+
+    @method_decorator(data_version_condition(get_global_namespace))
+    def list(self, request, *args, **kwargs):
+        return super(ModelViewSet, self).list(request, *args, **kwargs)
+
+    @method_decorator(data_version_condition(get_global_namespace))
+    def retrieve(self, request, *args, **kwargs):
+        return super(ModelViewSet, self).retrieve(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        super(ModelViewSet, self).perform_update(serializer)
+        # the response is serialized from the updated instance, whose prefetched related
+        # objects are now out of date
+        serializer.instance._prefetched_objects_cache = {}
+
+
+def pks(model):
+    """
+    Returns a queryset of model for prefetching, which only loads the primary keys that
+    the serializers need.
+    """
+    return model.objects.only('pk')
+
+
+class PlayerViewSet(ModelViewSet):
     """
     A model for a DG player. Create one instance per human.
     """
@@ -30,7 +197,7 @@ class PlayerViewSet(viewsets.ModelViewSet):
     serializer_class = dgs.api.serializers.PlayerSerializer
 
 
-class ContestantViewSet(viewsets.ModelViewSet):
+class ContestantViewSet(ModelViewSet):
     """
     A model for a contestant in a League. Extends a Player by adding an optional initial handicap for them.
     A League object relates to several Contestant objects. If initial HC is not specified, then it will be
@@ -39,8 +206,38 @@ class ContestantViewSet(viewsets.ModelViewSet):
     queryset = models.Contestant.objects.all()
     serializer_class = dgs.api.serializers.ContestantSerializer
 
+    @detail_route()
+    @method_decorator(data_version_condition(get_version=get_contestant_league_version))
+    def latest_cards(self, request, pk=None):
+        """
+        Returns the contestant's latest completed cards, latest first. Optional query parameters
+        are `n`, the number of cards (defaults to the league's max cards to consider for HC), and
+        `event`, the ID of an event to return the latest cards as at.
+        """
+        contestant = self.get_object()
+        league = contestant.league_set.first()
+        if league is None:
+            return Response([])
+        snapshot = league.get_snapshot()
+        try:
+            n = int(request.query_params.get('n', league.handicap_max_rounds_avg))
+            event_pk = request.query_params.get('event')
+            event_pk = event_pk and int(event_pk)
+        except ValueError:
+            raise ValidationError("n and event must be integers")
+        date = None
+        if event_pk:
+            if event_pk not in snapshot.event_map:
+                raise NotFound("No such event in the contestant's league")
+            date = snapshot.get_event(event_pk).date
+        return Response([{
+            'card': reverse('card-detail', args=[completed_card.card.pk], request=request),
+            'date': completed_card.card.date,
+            'scratch_delta': completed_card.scratch_delta,
+            } for completed_card in snapshot.get_card_index().latest(contestant.pk, date, n)])
+
 
-class HoleViewSet(viewsets.ModelViewSet):
+class HoleViewSet(ModelViewSet):
     """
     A simple model to represent a hole.
     """
@@ -48,24 +245,24 @@ class HoleViewSet(viewsets.ModelViewSet):
     serializer_class = dgs.api.serializers.HoleSerializer
 
 
-class LayoutViewSet(viewsets.ModelViewSet):
+class LayoutViewSet(ModelViewSet):
     """
     A model to represent a Layout of a series of Hole objects.
     Courses relate to one or more Layouts.
     """
-    queryset = models.Layout.objects.all()
+    queryset = models.Layout.objects.prefetch_related(Prefetch('holes', queryset=pks(models.Hole)))
     serializer_class = dgs.api.serializers.LayoutSerializer
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(ModelViewSet):
     """
     A model to represent a DG course that can contain one or more Layouts.
     """
-    queryset = models.Course.objects.all()
+    queryset = models.Course.objects.prefetch_related(Prefetch('layouts', queryset=pks(models.Layout)))
     serializer_class = dgs.api.serializers.CourseSerializer
 
 
-class ScoreViewSet(viewsets.ModelViewSet):
+class ScoreViewSet(ModelViewSet):
     """
     A simple view that stores the scratch score of a Contestant after a round. Cards relate to
     one Score per player on a Card.
@@ -74,15 +271,26 @@ class ScoreViewSet(viewsets.ModelViewSet):
     serializer_class = dgs.api.serializers.ScoreSerializer
 
 
-class CardViewSet(viewsets.ModelViewSet):
+class CardViewSet(ModelViewSet):
     """
     A model for a Card that stores Course, Layout and one or more Scores.
     """
-    queryset = models.Card.objects.all()
+    queryset = models.Card.objects.prefetch_related(Prefetch('scores', queryset=pks(models.Score)))
     serializer_class = dgs.api.serializers.CardSerializer
 
+    @list_route(methods=['post'])
+    def enter(self, request):
+        """
+        Creates a card and all of its scores in one go, eg:
+
+            {"course": ..., "layout": ..., "date": ..., "scores": [{"contestant": ..., "strokes": 54}, ...]}
 
-class AwardViewSet(viewsets.ModelViewSet):
+        Scores are dated with the card. Post a list of cards to create several at once.
+        """
+        return enter_cards(self, request)
+
+
+class AwardViewSet(ModelViewSet):
     """
     A generic Award model to capture awards for a Contestant such as Ace (hole in one)
     or CTP (closest to pin). Event objects relate to one or more Awards.
@@ -91,20 +299,71 @@ class AwardViewSet(viewsets.ModelViewSet):
     serializer_class = dgs.api.serializers.AwardSerializer
 
 
-class EventViewSet(viewsets.ModelViewSet):
+class EventViewSet(ModelViewSet):
     """
     A model to store a league day or a similar event. Records the requisite number of rounds a
     Contestant is required to play during the event as well as Awards and Cards created during the
     Event.
     """
-    queryset = models.Event.objects.all()
+    queryset = models.Event.objects.prefetch_related(Prefetch('awards', queryset=pks(models.Award)), Prefetch('cards', queryset=pks(models.Card)))
     serializer_class = dgs.api.serializers.EventSerializer
 
+    @detail_route(methods=['post'])
+    def enter(self, request, pk=None):
+        """
+        Creates cards and all of their scores in one go and adds them to the event. Takes a
+        card, or a list of cards, as for /api/card/enter/.
+        """
+        return enter_cards(self, request, self.get_object())
+
+    @detail_route()
+    @method_decorator(data_version_condition(get_version=get_event_league_version))
+    def results(self, request, pk=None):
+        """
+        The event's results in rank order, as shown on the home page.
+        """
+        event = self.get_object()
+        league = event.league
+        if league is None:
+            raise NotFound("Event is not in a league")
+        results = get_cached_result('api_event_results_%s' % event.pk, league.pk, lambda: [
+                dict(stats, contestant=contestant.pk, player=contestant.player_id, name=contestant.player.name)
+                for contestant, stats in league.get_snapshot().get_event(event.pk).result.items()])
+        return Response([dict(row,
+                              contestant=reverse('contestant-detail', args=[row['contestant']], request=request),
+                              player=reverse('player-detail', args=[row['player']], request=request))
+                         for row in results])
 
-class LeagueViewSet(viewsets.ModelViewSet):
+
+class LeagueViewSet(ModelViewSet):
     """
     A model to represent a League. Stores all Events and Contestants associated with it.
     """
-    queryset = models.League.objects.all()
+    queryset = models.League.objects.prefetch_related(Prefetch('contestants', queryset=pks(models.Contestant)), Prefetch('events', queryset=pks(models.Event)))
     serializer_class = dgs.api.serializers.LeagueSerializer
 
+    @detail_route()
+    @method_decorator(data_version_condition(get_league_namespace))
+    def standings(self, request, pk=None):
+        """
+        The league's standings in rank order, as shown on the home page.
+        """
+        league = self.get_object()
+        standings = get_cached_result('api_league_standings_%s' % league.pk, league.pk, lambda: [
+                dict(stats, player=player.pk, name=player.name) for player, stats in league.result.items()])
+        return Response([dict(row, player=reverse('player-detail', args=[row['player']], request=request))
+                         for row in standings])
+
+    @detail_route(renderer_classes=[dgs.api.renderers.NDJSONRenderer, dgs.api.renderers.CSVRenderer])
+    @method_decorator(data_version_condition(get_league_namespace))
+    def export(self, request, pk=None):
+        """
+        Streams the league's whole history: its events, cards, scores and per-event results,
+        one record per line, as NDJSON or, with `?format=csv`, CSV.
+        """
+        league = self.get_object()
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(renderer.lines(export.get_records(league)), content_type=renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="league_%s.%s"' % (league.pk, renderer.format)
+        return response
+
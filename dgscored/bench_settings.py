@@ -0,0 +1,15 @@
+# Settings for running the dgs_bench command against a throwaway in-memory SQLite database, eg:
+#     dgscored dgs_bench --settings=dgscored.bench_settings
+from dgscored.settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+ALLOWED_HOSTS = ['testserver']
+
+# the in-memory database isn't visible to other threads
+DGS_BACKGROUND_REVALIDATION = False
@@ -120,6 +120,7 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'dgs.middleware.InstrumentationMiddleware',
     # Uncomment the next line for simple clickjacking protection:
     # 'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
@@ -168,7 +169,11 @@ LOGGING = {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
-        }
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django.request': {
@@ -176,22 +181,52 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        # one JSON line per request with its query count, cache hits and timings, when
+        # DGS_INSTRUMENTATION is on
+        'dgs.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     }
 }
 
 # Cache setting
+# Recently used values are kept in memory by each process, in front of the shared cache.
 CACHES = {
     'default': {
+        'BACKEND': 'dgs.cache.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'MAX_ENTRIES': 500,
+        },
+    },
+    'shared': {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'dgs_cache',
-    }
+    },
 }
 
+# Log the query count, cache hits and timings of every request to the 'dgs.instrumentation'
+# logger, and return them to staff users in X-DGS-* response headers. Off by default, since
+# it records the SQL of every query.
+DGS_INSTRUMENTATION = False
+
+# Recompute stale cached pages in a background thread while the stale page is served.
+# Set to False to recompute synchronously, eg. when running tests against an in-memory database.
+DGS_BACKGROUND_REVALIDATION = True
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         #'rest_framework.permissions.IsAdminUser',
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'dgs.api.renderers.CompactJSONRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'dgs.api.pagination.PageNumberPagination',
     'PAGE_SIZE': 10
 }
 
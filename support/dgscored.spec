@@ -69,6 +69,7 @@ mysql -uroot -e "
 /opt/%{name}/bin/%{name} createcachetable
 /opt/%{name}/bin/%{name} syncdb --noinput
 /opt/%{name}/bin/%{name} migrate --fake-initial
+/opt/%{name}/bin/%{name} dgs_rebuild_results
 
 # Start the services
 /bin/systemctl start %{name}.service > /dev/null 2>&1 || :